@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+# title           :analyze.py
+# description     :Analyzes many positions or games and prints JSON lines
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python analyze.py [file] [--depth N | --time S] [--every]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, BOARD_SIZE
+from reversi import Reversi
+from reversiboard import tile_name
+from bitboard import BitBoard
+from endgame import to_string, from_string
+from record import GameRecord, from_transcript, replay
+from concurrent.futures import ProcessPoolExecutor, Future
+from collections import deque
+import argparse
+import json
+import os
+import signal
+import sys
+from time import time
+
+# Input: one position per line in the endgame.to_string format, such as
+# "---...XO--- X", or one game per line as a transcript such as f5d6c3. A
+# transcript is analyzed at its final position, or at every position with
+# --every. Output: one JSON object per position, in input order.
+#
+# The move and score are for "turn", the player who moves next. That is the
+# player to move in the position, or the other player with "pass" set if the
+# player to move has to pass. With "exact" set the score is the final disc
+# differential from solving the game, and otherwise a heuristic value.
+
+WINDOW = 4                      # Positions queued per worker
+
+# The engine of a worker process, set up by init_worker
+_engine = None
+
+
+def init_worker(depth, budget):
+    '''Creates the engine of a worker process, searching to depth or for
+       budget seconds. Ctrl-C is left to the main process.
+    '''
+
+    global _engine
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _engine = Reversi(BitBoard)
+    _engine.book = None
+    if depth:
+        _engine.time_cut     = False
+        _engine.cutoff_depth = depth
+    else:
+        _engine.time_cut     = True
+        _engine.cutoff_time  = budget
+
+
+def color_name(color):
+    '''Returns the name of a player as used in the output'''
+    return 'black' if color is BLACK else 'white'
+
+
+def analyze_position(code):
+    '''Searches an encoded position in a worker process. Returns a dict of
+       the best move, its score, whose move it is, whether the player to
+       move had to pass, whether the score is exact, the depth reached, the
+       nodes searched and the time taken. Every position is searched from
+       an empty transposition table, so results do not depend on the order
+       the positions are analyzed in.
+    '''
+
+    start = time()
+    board = _engine.board
+    board.set_position(*code)
+    passed = board.valid_moves() == []
+    if passed:
+        board.switch_turns()
+        if board.valid_moves() == []:
+            board.switch_turns()
+            turn = board.turn
+            return {'move': None, 'turn': color_name(turn), 'pass': False,
+                    'exact': True, 'depth': 0, 'nodes': 0, 'time': 0.0,
+                    'score': board.score[turn] -
+                    board.score[board.opposite(turn)]}
+
+    _engine.clear_memory()
+    _engine.alpha_beta_search()
+    move = _engine.get_optimal_move()
+    return {'move': tile_name(move), 'turn': color_name(board.turn),
+            'pass': passed, 'exact': _engine.solved,
+            'score': _engine.root.value, 'depth': _engine.depth_reached,
+            'nodes': _engine.nodes, 'time': time() - start}
+
+
+def read_positions(lines, every=False):
+    '''Yields a (info, code) pair for every position in lines, where info is
+       a dict describing where the position came from and code the encoded
+       position. code is None, with an error in info, for a line that could
+       not be read.
+    '''
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if len(line.split()) == 2:
+                board = from_string(line)
+                if board.size != BOARD_SIZE:
+                    raise ValueError('Not a {0}x{0} position'.format(
+                        BOARD_SIZE))
+                yield {'line': number}, board.encode()
+                continue
+
+            record = GameRecord(from_transcript(line))
+            if not every:
+                board = record.final_board(BitBoard)
+                yield {'line': number, 'ply': len(record.moves)}, \
+                    board.encode()
+                continue
+
+            board = BitBoard(BOARD_SIZE)
+            code  = board.encode()
+            for ply, (board, move) in enumerate(replay(record, BitBoard)):
+                yield {'line': number, 'ply': ply,
+                       'played': tile_name(move)}, code
+                code = board.encode()
+        except ValueError as e:
+            yield {'line': number, 'error': str(e)}, None
+
+
+def done(value):
+    '''Returns a finished Future holding value'''
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def analyze(lines, out, depth=0, budget=1.0, every=False, workers=None):
+    '''Analyzes the positions in lines over a process pool, writing a JSON
+       line for each to out in input order. At most WINDOW positions per
+       worker are in flight, so memory use does not grow with the input.
+       Returns the number of positions analyzed.
+    '''
+
+    workers = workers or os.cpu_count() or 1
+    pool    = ProcessPoolExecutor(workers, initializer=init_worker,
+                                  initargs=(depth, budget))
+    window  = deque()
+    count   = 0
+
+    def write_oldest():
+        info, future = window.popleft()
+        info.update(future.result())
+        out.write(json.dumps(info) + '\n')
+        out.flush()
+
+    try:
+        for info, code in read_positions(lines, every):
+            if code is None:
+                window.append((info, done({})))
+            else:
+                info['position'] = position_string(code)
+                window.append((info, pool.submit(analyze_position, code)))
+                count += 1
+            if len(window) >= workers * WINDOW:
+                write_oldest()
+        while window:
+            write_oldest()
+    finally:
+        for info, future in window:
+            future.cancel()
+        pool.shutdown()
+
+    return count
+
+
+def position_string(code):
+    '''Returns an encoded position in the endgame.to_string format'''
+    board = BitBoard(BOARD_SIZE)
+    board.set_position(*code)
+    return to_string(board)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Analyzes positions or games, one per line, and prints '
+                    'the results as JSON lines')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='file to read, - for stdin')
+    parser.add_argument('--depth', type=int, default=0,
+                        help='search depth, 0 to search for --time')
+    parser.add_argument('--time', type=float, default=1.0,
+                        help='search time per position with --depth 0')
+    parser.add_argument('--every', action='store_true',
+                        help='analyze every position of a transcript')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    lines = sys.stdin if args.input == '-' else open(args.input)
+    start = time()
+    try:
+        count = analyze(lines, sys.stdout, args.depth, args.time, args.every,
+                        args.workers)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    spent = time() - start
+    print('{} positions in {:.1f}s, {:.1f} positions/s'.format(
+        count, spent, count / spent if spent else 0.0), file=sys.stderr)
@@ -0,0 +1,204 @@
+#! /usr/bin/env python
+# title           :batchboard.py
+# description     :Vectorized move generation for many Reversi boards at once
+# author          :andresthor
+# date            :05-02-2017
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, EMPTY
+import bitboard as bb
+import numpy as np
+
+# Batches are always 8x8, so each side fits in one unsigned 64 bit integer.
+# Bits use the same layout as bitboard.BitBoard.
+SIZE    = 8
+FULL    = np.uint64(0xFFFFFFFFFFFFFFFF)
+CORNERS = np.uint64(sum(1 << bb.bit_index(t, SIZE)
+                        for t in [(1, 1), (1, SIZE), (SIZE, 1), (SIZE, SIZE)]))
+SHIFTS  = [(np.uint64(abs(s)), s > 0, np.uint64(mask))
+           for s, mask in bb.shift_table(SIZE).values()]
+TILES   = [(c, r) for c in range(1, SIZE + 1) for r in range(1, SIZE + 1)]
+PASS    = -1
+
+# Number of set bits for every byte value, for counting 64 bit words
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(words):
+    '''Returns the number of set bits in each element of a uint64 array'''
+    as_bytes = words.view(np.uint8).reshape(words.shape + (8,))
+    return _POPCOUNT[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def shift(x, amount, left, mask):
+    '''Shifts every element of x one step in a direction, see shift_table'''
+    if left:
+        return (x << amount) & mask
+    return (x >> amount) & mask
+
+
+def board_bits(board):
+    '''Returns (black, white) bitboards for a ReversiBoard or BitBoard'''
+    black, white, turn = board.encode()
+    return black, white
+
+
+class BatchBoard(object):
+    '''
+        Holds N 8x8 positions as NumPy arrays and works on all of them at once.
+
+        black and white are uint64 arrays of bitboards, and turn is True
+        where WHITE is to move. Legal moves, move making and evaluation are
+        all vectorized over the batch, and agree with BitBoard and
+        ReversiBoard position by position.
+    '''
+
+    def __init__(self, black, white, turn):
+        self.black = np.asarray(black, dtype=np.uint64)
+        self.white = np.asarray(white, dtype=np.uint64)
+        self.turn  = np.asarray(turn, dtype=bool)
+
+    @classmethod
+    def from_boards(cls, boards):
+        '''Builds a batch from a list of ReversiBoard or BitBoard objects'''
+        bits  = [board_bits(b) for b in boards]
+        black = np.array([b for b, w in bits], dtype=np.uint64)
+        white = np.array([w for b, w in bits], dtype=np.uint64)
+        turn  = np.array([b.turn is WHITE for b in boards], dtype=bool)
+        return cls(black, white, turn)
+
+    def to_boards(self):
+        '''Returns the positions as a list of BitBoard objects'''
+        boards = []
+        for black, white, turn in zip(self.black, self.white, self.turn):
+            board = bb.BitBoard(SIZE)
+            board.set_tiles(TILES, EMPTY)
+            board.set_tiles(bb.bits_to_tiles(int(black), SIZE), BLACK)
+            board.set_tiles(bb.bits_to_tiles(int(white), SIZE), WHITE)
+            if board.turn is not (WHITE if turn else BLACK):
+                board.switch_turns()
+            board.last = None
+            boards.append(board)
+        return boards
+
+    def __len__(self):
+        return len(self.black)
+
+    def sides(self):
+        '''Returns (own, opponent) bitboards from the side to move's view'''
+        own = np.where(self.turn, self.white, self.black)
+        opp = np.where(self.turn, self.black, self.white)
+        return own, opp
+
+    def legal_moves(self, opponent=False):
+        '''Returns a uint64 array with the legal moves of every position, for
+           the side to move, or for the other side if opponent is True.
+        '''
+
+        own, opp = self.sides()
+        if opponent:
+            own, opp = opp, own
+        empty = ~(own | opp) & FULL
+        moves = np.zeros(len(self), dtype=np.uint64)
+
+        for amount, left, mask in SHIFTS:
+            x = shift(own, amount, left, mask) & opp
+            for _ in range(SIZE - 3):
+                x |= shift(x, amount, left, mask) & opp
+            moves |= shift(x, amount, left, mask) & empty
+
+        return moves
+
+    def mobility(self, opponent=False):
+        '''Returns the number of legal moves in every position'''
+        return popcount(self.legal_moves(opponent))
+
+    def flips(self, squares):
+        '''Returns the discs flipped by playing the bit index squares[i] in
+           position i. Entries equal to PASS flip nothing.
+        '''
+
+        squares = np.asarray(squares, dtype=np.int64)
+        played  = squares != PASS
+        move    = np.where(played,
+                           np.left_shift(np.uint64(1),
+                                         np.maximum(squares, 0)
+                                         .astype(np.uint64)),
+                           np.uint64(0))
+
+        own, opp = self.sides()
+        flips    = np.zeros(len(self), dtype=np.uint64)
+        for amount, left, mask in SHIFTS:
+            x = shift(move, amount, left, mask) & opp
+            for _ in range(SIZE - 3):
+                x |= shift(x, amount, left, mask) & opp
+            # The run of opponent discs is only flipped if capped by own disc
+            capped = (shift(x, amount, left, mask) & own) != 0
+            flips |= np.where(capped, x, np.uint64(0))
+
+        return move, flips
+
+    def apply(self, squares):
+        '''Returns a new batch where the side to move in position i has played
+           the bit index squares[i], or passed if it is PASS.
+           Raises ValueError if any of the moves is not legal.
+        '''
+
+        move, flips = self.flips(squares)
+        played = move != 0
+        if np.any(played & ((self.legal_moves() & move) == 0)):
+            raise ValueError('Batch contains an illegal move')
+
+        own, opp = self.sides()
+        own = own | move | flips
+        opp = opp & ~flips
+        black = np.where(self.turn, opp, own)
+        white = np.where(self.turn, own, opp)
+        return BatchBoard(black, white, ~self.turn)
+
+    def expand(self):
+        '''Generates every child of every position. Returns a tuple of
+           (children, parents, squares), where child i was reached from
+           position parents[i] by playing squares[i]. Positions without a
+           legal move get a single PASS child.
+        '''
+
+        legal    = self.legal_moves()
+        as_bytes = legal.astype('<u8').view(np.uint8).reshape(len(self), 8)
+        as_bits  = np.unpackbits(as_bytes, axis=1, bitorder='little')
+        parents, squares = np.nonzero(as_bits)
+
+        stuck = np.nonzero(legal == 0)[0]
+        if len(stuck):
+            parents = np.concatenate([parents, stuck])
+            squares = np.concatenate([squares,
+                                      np.full(len(stuck), PASS, np.int64)])
+            order   = np.argsort(parents, kind='stable')
+            parents, squares = parents[order], squares[order]
+
+        parent = BatchBoard(self.black[parents], self.white[parents],
+                            self.turn[parents])
+        return parent.apply(squares), parents, squares
+
+    def evaluate(self):
+        '''Returns the Reversi.eval heuristic of every position, from the view
+           of the side to move, as a float array.
+        '''
+
+        own, opp = self.sides()
+        weights  = {'score': 500, 'corners': 100, 'mobility': 300}
+
+        def term(mine, theirs, weight):
+            mine   = mine.astype(np.float64)
+            theirs = theirs.astype(np.float64)
+            total  = mine + theirs
+            safe   = np.where(total != 0, total, 1)
+            return np.where(total != 0, weight * (mine - theirs) / safe, 0.0)
+
+        p = term(popcount(own), popcount(opp), weights['score'])
+        c = term(popcount(own & CORNERS), popcount(opp & CORNERS),
+                 weights['corners'])
+        m = term(self.mobility(), self.mobility(opponent=True),
+                 weights['mobility'])
+        return p + c + m
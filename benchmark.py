@@ -0,0 +1,222 @@
+#! /usr/bin/env python
+# title           :benchmark.py
+# description     :Benchmarks move generation and search on fixed positions
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python benchmark.py [--depth N] [--sizes 8,10,12,16]
+# python_version  :3.5.2
+# =============================================================================
+
+from tournament import make_engine
+from endgame import EndgameSolver, from_string
+from bitboard import BitBoard
+import perft
+import argparse
+import json
+import platform
+import random
+import subprocess
+import tracemalloc
+from time import time
+
+# Fixed test positions, in the endgame.to_string format
+MIDGAME = {
+    'mid44': '-O--------OO-------OO-----XOO----XXOO----XOX----OX-XXX----------'
+             ' X',
+    'mid36': '-------X------X--XXXXX----XXXX--OOXXXO---OOOOX---XXXX---X--X----'
+             ' X',
+    'mid28': '--O-OX----OOOX--XXO-OOOO-OXXOOO-OXXXOO--X-X-OX-----XXOX-------OX'
+             ' X',
+}
+ENDGAME = {
+    'end12a': '--OOO-OXOOOOOOXXOOXXOXOXOOXOXOXXOOOOOOOX-OOXX---OOOOOX-----OOOOO'
+              ' X',
+    'end12b': '-XXX--O-XXXXXOOX--OXOOOXOOOOXXOXOOOXXXOOOOOOOOX--OOOOOOX--O-X-XO'
+              ' X',
+    'end14':  '-O-XXXX-O-XXXO-O-OOXOXO-XXOOOOXXXX-OOOXXXOOOOO-XXO-OX-OX--OOXX-X'
+              ' X',
+}
+
+BACKENDS = ['list', 'bitboard']
+SIZES    = [8, 10, 12, 16]
+
+# Search options, as engine configurations for tournament.make_engine
+OPTIONS = {
+    'alphabeta': {'pvs': False, 'aspiration': 0, 'orderer': None},
+    'ordered':   {'pvs': False, 'aspiration': 0},
+    'pvs':       {},
+    'patterns':  {'eval': 'patterns'},
+}
+
+
+def commit():
+    '''Returns the current git commit, or None outside a git checkout'''
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                      stderr=subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def search_engine(backend, option, position, depth):
+    '''Returns an engine set up to search position to a fixed depth'''
+    config = dict(OPTIONS[option], board=backend, time_cut=False,
+                  cutoff_depth=depth, solver=None)
+    engine = make_engine(config)
+    engine.board.set_position(*from_string(position).encode())
+    return engine
+
+
+def bench_search(backend, option, name, position, depth):
+    '''Searches a position to depth and returns its results as a dict. The
+       search is run twice with fresh engines: once for the timings, and once
+       under tracemalloc for the memory peak.
+    '''
+
+    engine = search_engine(backend, option, position, depth)
+    depths = {}
+    calc   = engine.calc_optimal_move
+
+    def timed_calc():
+        depths[engine.depth_reached] = time() - engine.alpha_timer
+        calc()
+
+    engine.calc_optimal_move = timed_calc
+    start = time()
+    engine.alpha_beta_search()
+    spent = time() - start
+
+    nodes  = engine.nodes
+    move   = engine.get_optimal_move()
+    engine = search_engine(backend, option, position, depth)
+    tracemalloc.start()
+    engine.alpha_beta_search()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'kind': 'search', 'backend': backend, 'option': option,
+            'position': name, 'depth': depth, 'move': move, 'nodes': nodes,
+            'seconds': spent, 'nps': nodes / spent if spent else 0.0,
+            'time_to_depth': dict((str(d), t)
+                                  for d, t in sorted(depths.items())),
+            'peak_bytes': peak}
+
+
+def bench_endgame(name, position):
+    '''Solves an endgame position and returns its results as a dict'''
+
+    board  = from_string(position)
+    solver = EndgameSolver(board.size)
+    start  = time()
+    value, move = solver.solve(board)
+    spent  = time() - start
+
+    solver = EndgameSolver(board.size)
+    tracemalloc.start()
+    solver.solve(board)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'kind': 'endgame', 'position': name, 'empties': board.empties,
+            'value': value, 'move': move, 'nodes': solver.nodes,
+            'seconds': spent, 'nps': solver.nodes / spent if spent else 0.0,
+            'peak_bytes': peak}
+
+
+def bench_perft(backend, depth):
+    '''Runs perft from the start position and returns the deepest result'''
+    d, count, spent, ok = perft.run(perft.BOARDS[backend], depth)[-1]
+    return {'kind': 'perft', 'backend': backend, 'depth': d, 'leaves': count,
+            'ok': ok, 'seconds': spent, 'nps': count / spent if spent else 0.0}
+
+
+def size_positions(size, count=4, seed=0):
+    '''Returns count positions on a size x size board, each reached by
+       random moves until a third of the board is filled, as encoded tuples.
+    '''
+
+    rng       = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = BitBoard(size)
+        while board.empties > 2 * size * size // 3:
+            moves = board.valid_moves()
+            if moves == []:
+                break
+            board.do_move(rng.choice(moves))
+        if board.valid_moves() != []:
+            positions.append(board.encode())
+    return positions
+
+
+def bench_size(backend, size, depth, perft_depth):
+    '''Searches midgame positions on a size x size board to depth, and runs
+       perft from its start position. Returns the results as a dict, to show
+       how the speed changes with the board size.
+    '''
+
+    engine = make_engine({'board': backend, 'size': size, 'time_cut': False,
+                          'cutoff_depth': depth, 'solver': None})
+    nodes, spent = 0, 0.0
+    for code in size_positions(size):
+        engine.board.set_position(*code)
+        start = time()
+        engine.alpha_beta_search()
+        spent += time() - start
+        nodes += engine.nodes
+
+    d, count, seconds, ok = perft.run(perft.BOARDS[backend], perft_depth,
+                                      size)[-1]
+    return {'kind': 'size', 'backend': backend, 'size': size, 'depth': depth,
+            'nodes': nodes, 'seconds': spent,
+            'nps': nodes / spent if spent else 0.0, 'perft_depth': d,
+            'perft_leaves': count,
+            'perft_nps': count / seconds if seconds else 0.0}
+
+
+def run(backends, options, depth, perft_depth, sizes=SIZES, size_depth=4):
+    '''Runs the whole suite and returns the report as a dict'''
+
+    results = []
+    for backend in backends:
+        results.append(bench_perft(backend, perft_depth))
+        for option in options:
+            for name, position in sorted(MIDGAME.items()):
+                results.append(bench_search(backend, option, name, position,
+                                            depth))
+        for size in sizes:
+            results.append(bench_size(backend, size, size_depth,
+                                      min(perft_depth, 5)))
+    for name, position in sorted(ENDGAME.items()):
+        results.append(bench_endgame(name, position))
+
+    return {'commit': commit(), 'python': platform.python_version(),
+            'machine': platform.machine(), 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks move generation and search, as JSON')
+    parser.add_argument('--depth', type=int, default=6,
+                        help='search depth of the midgame positions')
+    parser.add_argument('--perft', type=int, default=6,
+                        help='perft depth from the start position')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--options', default=','.join(sorted(OPTIONS)))
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='board sizes to compare, empty for none')
+    parser.add_argument('--size-depth', type=int, default=4,
+                        help='search depth of the board size comparison')
+    parser.add_argument('--output', help='file to write, default stdout')
+    args = parser.parse_args()
+
+    sizes  = [int(s) for s in args.sizes.split(',') if s]
+    report = run(args.backends.split(','), args.options.split(','),
+                 args.depth, args.perft, sizes, args.size_depth)
+    text   = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,360 @@
+#! /usr/bin/env python
+# title           :bitboard.py
+# description     :A bitboard implementation of the Reversi game-board
+# author          :andresthor
+# date            :05-02-2017
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, EMPTY
+import reversiboard as rb
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bits):
+        '''Returns the number of set bits in bits'''
+        return bin(bits).count('1')
+
+
+def bit_index(tile, size):
+    '''Returns the bit index of a (column, row) tuple. Bits are laid out column
+       by column, so iterating from the lowest bit follows the same order as
+       ReversiBoard.valid_moves.
+    '''
+    return (tile[0] - 1) * size + (tile[1] - 1)
+
+
+def bit_tile(index, size):
+    '''Returns the (column, row) tuple of a bit index'''
+    return (index // size + 1, index % size + 1)
+
+
+def bits_to_tiles(bits, size):
+    '''Returns a list of the tiles for every set bit, lowest bit first'''
+    tiles = []
+    while bits:
+        low = bits & -bits
+        tiles.append(bit_tile(low.bit_length() - 1, size))
+        bits ^= low
+    return tiles
+
+
+def shift_table(size):
+    '''Builds the (shift, mask) pairs for the eight move directions. A positive
+       shift moves bits towards higher indexes. The mask removes the bits that
+       wrapped around from one column to the next.
+    '''
+
+    full     = (1 << (size * size)) - 1
+    first    = 0
+    last     = 0
+    for col in range(size):
+        first |= 1 << (col * size)
+        last  |= 1 << (col * size + size - 1)
+
+    table = {}
+    for d in rb.DIRECTIONS:
+        mask = full
+        if d[1] == 1:
+            mask &= ~first
+        elif d[1] == -1:
+            mask &= ~last
+        table[d] = (d[0] * size + d[1], mask)
+
+    return table
+
+
+class BitBoard(rb.ReversiBoard):
+    '''A ReversiBoard that stores each side as a single integer bitboard.
+
+       Move generation, flipping and counting are done with shifts and masks
+       over the whole board at once. The public interface is the same as the
+       one of ReversiBoard, so the two can be used interchangeably.
+    '''
+
+    def __init__(self, size):
+        self.size  = size
+        self.bits  = {BLACK: 0, WHITE: 0}
+        self.score = {BLACK: 0, WHITE: 0}
+        self.turn  = None
+        self.last  = None
+        self.dirs  = rb.DIRECTIONS
+        self.hash  = 0
+
+        self.keys, self.turn_key = rb.zobrist_keys(size)
+
+        # Legal moves are cached as bitboards, as in ReversiBoard
+        self.version    = 0
+        self.move_cache = {BLACK: None, WHITE: None}
+        self.move_stats = {'hits': 0, 'misses': 0}
+
+        self.full   = (1 << (size * size)) - 1
+        self.shifts = shift_table(size)
+
+        # The shifts of every step of the fill in move_bits: 1, 2, 4... times
+        # the shift of the direction, enough to cross size - 2 discs
+        self.fills = [(s, mask, [abs(s) << k for k in
+                                 range((size - 2).bit_length())])
+                      for s, mask in self.shifts.values()]
+
+        # Kept up to date on every change, like in ReversiBoard. Corner discs
+        # can never be flipped, so the corner counts only change when a disc
+        # is placed on a corner.
+        self.empties     = size * size
+        self.corners     = {BLACK: 0, WHITE: 0}
+        self.corner_mask = 0
+        for corner in [(1, 1), (1, size), (size, 1), (size, size)]:
+            self.corner_mask |= 1 << bit_index(corner, size)
+
+        self.init_pieces()
+
+    def copy(self):
+        '''Returns an independent snapshot of the board'''
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.bits       = dict(self.bits)
+        other.score      = dict(self.score)
+        other.corners    = dict(self.corners)
+        other.move_cache = dict(self.move_cache)
+        return other
+
+    @property
+    def board(self):
+        '''A 2d array view of the board, in the same form as ReversiBoard'''
+        board = self.create_board(self.size, self.size)
+        for color in (BLACK, WHITE):
+            for (col, row) in bits_to_tiles(self.bits[color], self.size):
+                board[col - 1][row - 1] = color
+        return board
+
+    @property
+    def empty_squares(self):
+        '''A list of the empty tiles, in the same order as ReversiBoard'''
+        return bits_to_tiles(~(self.bits[BLACK] | self.bits[WHITE]) & self.full,
+                             self.size)
+
+    def set_tile(self, tile, color):
+        '''Sets a single tile (tuple) to "color". Updates the hash, the score,
+           the empty count and the corner counts to match.
+        '''
+
+        if not self.is_on_board(tile):
+            return
+        old = self.get_tile(tile)
+        if old is color:
+            return
+
+        index  = bit_index(tile, self.size)
+        bit    = 1 << index
+        corner = bit & self.corner_mask
+        if old is EMPTY:
+            self.empties -= 1
+        else:
+            self.bits[old] &= ~bit
+            self.hash ^= self.keys[old][index]
+            self.score[old] -= 1
+            if corner:
+                self.corners[old] -= 1
+
+        if color is EMPTY:
+            self.empties += 1
+        else:
+            self.bits[color] |= bit
+            self.hash ^= self.keys[color][index]
+            self.score[color] += 1
+            if corner:
+                self.corners[color] += 1
+        self.version += 1
+
+    def flip_hash(self, flips):
+        '''Returns the hash difference of flipping every disc in flips'''
+        black, white = self.keys[BLACK], self.keys[WHITE]
+        h = 0
+        while flips:
+            low    = flips & -flips
+            index  = low.bit_length() - 1
+            h     ^= black[index] ^ white[index]
+            flips ^= low
+        return h
+
+    def get_tile(self, tile):
+        '''Returns the value at the specified tile'''
+        bit = 1 << bit_index(tile, self.size)
+        if self.bits[BLACK] & bit:
+            return BLACK
+        if self.bits[WHITE] & bit:
+            return WHITE
+        return EMPTY
+
+    def is_occupied(self, tile):
+        '''Returns True if the tile is already occupied by a piece'''
+        bit = 1 << bit_index(tile, self.size)
+        return bool((self.bits[BLACK] | self.bits[WHITE]) & bit)
+
+    def can_flip(self, tile, color):
+        '''Returns True if setting tile to color will cause some piece(s) to be
+           flipped.
+        '''
+        bit = 1 << bit_index(tile, self.size)
+        return bool(self.cached_moves(color) & bit)
+
+    def flips_in_dir(self, tile, direction, color):
+        '''Returns a list of the tiles flipped in direction if tile is set to
+           color.
+        '''
+        bit   = 1 << bit_index(tile, self.size)
+        flips = self.ray_flips(bit, self.shifts[direction], color)
+        return bits_to_tiles(flips, self.size)
+
+    def flips(self, tile, color):
+        '''Checks all directions for flippable tiles, assuming tile is set to
+           color. Returns a list of the flippable tiles.
+        '''
+        bit = 1 << bit_index(tile, self.size)
+        return bits_to_tiles(self.flip_bits(bit, color), self.size)
+
+    def ray_flips(self, bit, shift, color):
+        '''Returns the bits flipped along a single direction when bit is set to
+           color.
+        '''
+        own, opp = self.bits[color], self.bits[self.opposite(color)]
+        s, mask  = shift
+        flips    = 0
+        step     = ((bit << s) if s > 0 else (bit >> -s)) & mask
+        while step & opp:
+            flips |= step
+            step = ((step << s) if s > 0 else (step >> -s)) & mask
+
+        return flips if step & own else 0
+
+    def flip_bits(self, bit, color):
+        '''Returns the bits flipped in all directions when bit is set to
+           color.
+        '''
+        flips = 0
+        for shift in self.shifts.values():
+            flips |= self.ray_flips(bit, shift, color)
+        return flips
+
+    def move_bits(self, color=None):
+        '''Returns a bitboard of all legal moves for color.
+
+           Runs of opponent discs are filled from the player's discs with a
+           Kogge-Stone fill, which doubles the distance covered on every
+           step, so a direction takes log2(size) steps instead of size.
+        '''
+        if color is None:
+            color = self.turn
+        own, opp = self.bits[color], self.bits[self.opposite(color)]
+        empty    = ~(own | opp) & self.full
+        moves    = 0
+
+        for s, mask, steps in self.fills:
+            pro = opp & mask
+            gen = own
+            if s > 0:
+                for k in steps:
+                    gen |= pro & (gen << k)
+                    pro &= pro << k
+                moves |= ((gen & opp) << s) & mask & empty
+            else:
+                for k in steps:
+                    gen |= pro & (gen >> k)
+                    pro &= pro >> k
+                moves |= ((gen & opp) >> -s) & mask & empty
+
+        return moves
+
+    def find_moves(self, color):
+        '''Returns the legal moves for color as a bitboard, without the
+           cache
+        '''
+        return self.move_bits(color)
+
+    def valid_moves(self, color=None):
+        '''Returns a list of legal moves for color'''
+        if color is None:
+            color = self.turn
+        return bits_to_tiles(self.cached_moves(color), self.size)
+
+    def mobility(self, color=None):
+        '''Returns the number of legal moves for color'''
+        if color is None:
+            color = self.turn
+        return popcount(self.cached_moves(color))
+
+    def make_move(self, tile):
+        '''Makes a move in place and returns an undo record for undo_move, or
+           None if the move is not valid. The flipped discs are stored in the
+           record as a bitboard.
+        '''
+
+        if not self.is_on_board(tile):
+            return None
+        index = bit_index(tile, self.size)
+        bit   = 1 << index
+        if (self.bits[BLACK] | self.bits[WHITE]) & bit:
+            return None
+        flips = self.flip_bits(bit, self.turn)
+        if not flips:
+            return None
+
+        undo = (tile, flips, self.turn, self.last,
+                (self.score[BLACK], self.score[WHITE]))
+        count = popcount(flips)
+        other = self.opposite(self.turn)
+        self.hash ^= self.keys[self.turn][index] ^ self.flip_hash(flips)
+        self.bits[self.turn] |= flips | bit
+        self.bits[other]     &= ~flips
+        self.score[self.turn] += count + 1
+        self.score[other]     -= count
+        self.empties          -= 1
+        if bit & self.corner_mask:
+            self.corners[self.turn] += 1
+        self.switch_turns()
+        self.last = tile
+        return undo
+
+    def undo_move(self, undo):
+        '''Takes back a move made with make_move, using its undo record'''
+        tile, flips, turn, last, score = undo
+        index = bit_index(tile, self.size)
+        bit   = 1 << index
+        self.bits[turn] &= ~(flips | bit)
+        self.bits[self.opposite(turn)] |= flips
+        self.hash ^= self.keys[turn][index] ^ self.flip_hash(flips)
+        if self.turn is not turn:
+            self.hash ^= self.turn_key
+        if bit & self.corner_mask:
+            self.corners[turn] -= 1
+        self.empties += 1
+        self.version += 1
+        self.turn  = turn
+        self.last  = last
+        self.score[BLACK], self.score[WHITE] = score
+
+    def encode(self):
+        '''Returns the position as a compact (black, white, turn) tuple'''
+        return self.bits[BLACK], self.bits[WHITE], self.turn
+
+    def set_position(self, black, white, turn):
+        '''Sets up the position from a tuple returned by encode'''
+        self.bits    = {BLACK: black, WHITE: white}
+        self.empties = self.size * self.size - popcount(black | white)
+        self.corners = {BLACK: popcount(black & self.corner_mask),
+                        WHITE: popcount(white & self.corner_mask)}
+        self.turn    = turn
+        self.last    = None
+        self.calc_score()
+        self.hash    = self.compute_hash()
+        self.version += 1
+
+    def board_full(self):
+        '''Returns True if the board is full.'''
+        return self.empties == 0
+
+    def calc_score(self):
+        '''Calculates the score and stores in self.score'''
+        self.score[BLACK] = popcount(self.bits[BLACK])
+        self.score[WHITE] = popcount(self.bits[WHITE])
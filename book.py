@@ -0,0 +1,257 @@
+#! /usr/bin/env python
+# title           :book.py
+# description     :An opening book for Reversi, stored as a sorted binary file
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python book.py [plies] [search depth] [book file]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, BOOK_FILE, BOOK_PLIES, BOOK_DEPTH
+import bitboard as bb
+import mmap
+import os
+import struct
+import sys
+import warnings
+from time import time
+
+# Book file layout: a header of (magic, version, board size, record count),
+# then the records sorted by position. A record is the canonical position as
+# (black, white, turn), the best move as a bit index in the canonical
+# orientation, and the search value of the position.
+MAGIC   = b'RVBK'
+VERSION = 1
+SIZE    = 8
+HEADER  = struct.Struct('<4sBBI')
+RECORD  = struct.Struct('<QQBBh')
+TURNS   = {BLACK: 0, WHITE: 1}
+
+# The default book file, next to this module, so that it is found whatever
+# the working directory is
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), BOOK_FILE)
+
+# Books opened by open_book, as {real path: ((modification time, size),
+# Book)}
+_books = {}
+
+
+def symmetries(size):
+    '''Returns the eight symmetries of the board as lists of bit indexes,
+       where symmetry[i] is the index that bit i is moved to.
+    '''
+
+    last = size - 1
+    out  = []
+    for swap in (False, True):
+        for flip_col in (False, True):
+            for flip_row in (False, True):
+                perm = []
+                for i in range(size * size):
+                    col, row = divmod(i, size)
+                    if swap:
+                        col, row = row, col
+                    if flip_col:
+                        col = last - col
+                    if flip_row:
+                        row = last - row
+                    perm.append(col * size + row)
+                out.append(perm)
+    return out
+
+
+def transform(bits, perm):
+    '''Moves every set bit of bits as given by a symmetry'''
+    out = 0
+    while bits:
+        low   = bits & -bits
+        out  |= 1 << perm[low.bit_length() - 1]
+        bits ^= low
+    return out
+
+
+_SYMMETRIES = symmetries(SIZE)
+_INVERSES   = [[perm.index(i) for i in range(SIZE * SIZE)]
+               for perm in _SYMMETRIES]
+
+
+def canonical(black, white):
+    '''Returns (black, white, symmetry) for the smallest of the eight
+       symmetric versions of a position. Every position that is a rotation or
+       reflection of another gets the same canonical form.
+    '''
+
+    best = None
+    for k, perm in enumerate(_SYMMETRIES):
+        key = (transform(black, perm), transform(white, perm))
+        if best is None or key < best[:2]:
+            best = key + (k,)
+    return best
+
+
+class Book(object):
+    '''
+        An opening book, read from a file written by build_book.
+
+        The file is memory mapped, so processes that open the same book share
+        a single copy in the page cache. Lookups are a binary search over the
+        sorted records.
+    '''
+
+    def __init__(self, path=BOOK_PATH):
+        self.file = open(path, 'rb')
+        if os.fstat(self.file.fileno()).st_size < HEADER.size:
+            self.file.close()
+            raise ValueError('Not an opening book: {}'.format(path))
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or size != SIZE:
+            self.close()
+            raise ValueError('Not an opening book: {}'.format(path))
+        if len(self.data) < HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError('Opening book is cut short: {}'.format(path))
+
+    def close(self):
+        '''Unmaps and closes the book file'''
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        '''Returns record i as (black, white, turn, move, value)'''
+        return RECORD.unpack_from(self.data, HEADER.size + i * RECORD.size)
+
+    def find(self, key):
+        '''Returns the (move, value) stored for a canonical (black, white,
+           turn) key, or None if it is not in the book.
+        '''
+
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid    = (lo + hi) // 2
+            record = self.record(mid)
+            if record[:3] < key:
+                lo = mid + 1
+            elif record[:3] > key:
+                hi = mid
+            else:
+                return record[3], record[4]
+        return None
+
+    def probe(self, board):
+        '''Returns (move, value) from the book for the position on board, with
+           the move as a tile in the board's own orientation. Returns None if
+           the position is not in the book.
+        '''
+
+        if board.size != SIZE or self.data.closed:
+            return None
+        black, white, turn = board.encode()
+        black, white, k = canonical(black, white)
+        found = self.find((black, white, TURNS[turn]))
+        if found is None:
+            return None
+
+        move, value = found
+        return bb.bit_tile(_INVERSES[k][move], SIZE), value
+
+
+def open_book(path=BOOK_PATH):
+    '''Returns the Book in path, or None if there is no such file. A file
+       that cannot be read as a book is warned about and also gives None.
+
+       The Book is shared by every caller in the process, so engines do not
+       map the file again, and it should not be closed. Once the file
+       changes it is opened again and the old Book is closed, after which
+       it finds no moves.
+    '''
+
+    if not os.path.exists(path):
+        return None
+    stat  = os.stat(path)
+    real  = os.path.realpath(path)
+    key   = (stat.st_mtime_ns, stat.st_size)
+    entry = _books.get(real)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+    if entry is not None:
+        entry[1].close()
+        del _books[real]
+
+    try:
+        book = Book(path)
+    except (OSError, ValueError, struct.error) as e:
+        warnings.warn('Playing without the opening book: {}'.format(e))
+        return None
+    _books[real] = (key, book)
+    return book
+
+
+def book_positions(plies):
+    '''Returns every canonical position reachable from the start in fewer than
+       plies moves, as a dict of {(black, white, turn): BitBoard}.
+    '''
+
+    start     = bb.BitBoard(SIZE)
+    frontier  = [start]
+    positions = {}
+    for ply in range(plies):
+        children = []
+        for board in frontier:
+            black, white, turn = board.encode()
+            black, white, k = canonical(black, white)
+            key = (black, white, TURNS[turn])
+            if key in positions:
+                continue
+            positions[key] = board
+            for move in board.valid_moves():
+                child = board.copy()
+                child.do_move(move)
+                if child.valid_moves() != []:
+                    children.append(child)
+        frontier = children
+    return positions
+
+
+def build_book(path=BOOK_PATH, plies=BOOK_PLIES, depth=BOOK_DEPTH):
+    '''Builds an opening book of every position in the first plies moves.
+       Each position is searched to depth with the Reversi engine, and its
+       best move and value are stored. Returns the number of positions.
+    '''
+
+    from reversi import Reversi
+
+    engine = Reversi(bb.BitBoard)
+    engine.book         = None
+    engine.time_cut     = False
+    engine.cutoff_depth = depth
+
+    records = []
+    for (black, white, turn), board in book_positions(plies).items():
+        engine.board.set_position(black, white, board.turn)
+        engine.alpha_beta_search()
+        move = bb.bit_index(engine.get_optimal_move(), SIZE)
+        value = max(-32768, min(32767, int(round(engine.root.value))))
+        records.append((black, white, turn, move, value))
+
+    records.sort()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, SIZE, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+
+    return len(records)
+
+
+if __name__ == '__main__':
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else BOOK_PLIES
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else BOOK_DEPTH
+    path  = sys.argv[3] if len(sys.argv) > 3 else BOOK_PATH
+
+    start = time()
+    count = build_book(path, plies, depth)
+    print('Wrote {} positions to {} in {:.1f}s'.format(count, path,
+                                                       time() - start))
@@ -3,21 +3,21 @@
 # description     :Runs a cmd-line version of Reversi
 # author          :andresthor
 # date            :05-02-2017
-# usage           :python non_gui.py
+# usage           :python cmd_line.py [board size]
 # python_version  :3.5.2
 # =============================================================================
 
 from reversi import Reversi
+from reversiboard import tile_name, parse_tile
 from constants import BLACK, WHITE
+from bitboard import BitBoard
 from cmd import Cmd
+from string import ascii_lowercase
+import sys
 
 INVALID_INPUT = '\n'.join(['Input should be in the form x#',
-                           'where x is a lowercase letter between a-h',
-                           'and # is a number between 1-8'])
-
-NUMBERS = [1, 2, 3, 4, 5, 6, 7, 8]
-LETTERS = {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5, 'f': 6, 'g': 7, 'h': 8}
-LET_LST = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
+                           'where x is a lowercase letter between a-{}',
+                           'and # is a number between 1-{}'])
 
 
 class ReversiCMD(Cmd):
@@ -33,6 +33,7 @@ class ReversiCMD(Cmd):
     def __init__(self, reversi):
         Cmd.__init__(self)
         self.reversi = reversi
+        self.reversi.collect_stats = True
 
     def cmdloop(self):
         # print(intro)
@@ -49,55 +50,93 @@ class ReversiCMD(Cmd):
 
     def do_quit(self, line):
         '''Ends the program'''
+        self.reversi.cancel_search()
         return True
 
     def do_move(self, line):
-        if len(line) != 2:
-            print(INVALID_INPUT)
-            return
-
-        number = self.contains(line, NUMBERS)
-        letter = self.contains(line, LETTERS)
-
-        if not (letter and number):
-            print(INVALID_INPUT)
+        line = line.strip()
+        tile = parse_tile(line) or parse_tile(line[-1:] + line[:-1])
+        size = self.reversi.size
+        if tile is None or not self.reversi.board.is_on_board(tile):
+            print(INVALID_INPUT.format(ascii_lowercase[size - 1], size))
             return
 
-        if self.reversi.try_move((LETTERS[letter], number)):
+        if self.reversi.try_move(tile):
             self.print_board()
-            self.print_info((letter, number), BLACK)
+            self.print_info(tile_name(tile), BLACK)
             self.reversi.update()
             self.print_board()
             self.print_info(self.get_last_computer_move(), WHITE)
         else:
-            print('Invalid move: {}{}'.format(letter, number))
+            print('Invalid move: {}'.format(tile_name(tile)))
 
     def help_move(self):
-        print('move [x#] OR move [#x]\nWhere x is a letter a-h and # a nbr 1-8')
+        size = self.reversi.size
+        print('move [x#] OR move [#x]\nWhere x is a letter a-{} and # a nbr '
+              '1-{}'.format(ascii_lowercase[size - 1], size))
 
     def do_hint(self, line):
         '''Gives the player an optimal move hint (alpha-beta search)'''
         if not self.reversi.hints:
             self.reversi.toggle_hints()
-        self.reversi.alpha_beta_search()
 
-        move = self.reversi.get_optimal_move()
-        print('Optimal move: {}{}'.format(LET_LST[move[0] - 1], move[1]))
+        move = self.think()
+        if move is None:
+            print('No move found')
+            return
+        print('Optimal move: {}'.format(tile_name(move)))
 
     def do_cheat(self, line):
         '''Make optimal move'''
         if not self.reversi.hints:
             self.reversi.toggle_hints()
-        self.reversi.alpha_beta_search()
 
-        move = self.reversi.get_optimal_move()
-        self.do_move(LET_LST[move[0] - 1] + str(move[1]))
+        move = self.think()
+        if move is None:
+            print('No move found')
+            return
+        self.do_move(tile_name(move))
+
+    def think(self):
+        '''Runs the search in the background and prints the best move so far
+           every second. Ctrl-C stops the search early and keeps the best move
+           found so far. Returns the move, or None if there is none yet.
+        '''
+
+        self.reversi.start_search()
+        try:
+            done, move = self.reversi.await_search(1.0)
+            while not done:
+                if move is not None:
+                    print('Thinking... depth {}, best so far {}'.format(
+                        self.reversi.depth_reached, tile_name(move)))
+                done, move = self.reversi.await_search(1.0)
+        except KeyboardInterrupt:
+            self.reversi.cancel_search()
+            move = self.reversi.get_optimal_move()
+
+        return move
 
     def do_show(self, line):
         '''Prints out the current game state'''
         self.print_board()
         self.print_info(self.get_last_computer_move(), self.reversi.board.turn)
 
+    def do_ponder(self, line):
+        '''Toggles pondering, where the computer thinks on your time'''
+        self.reversi.ponder = not self.reversi.ponder
+        if not self.reversi.ponder:
+            self.reversi.cancel_search()
+        print('Pondering is {}'.format('on' if self.reversi.ponder else 'off'))
+        print(self.reversi.ponder_report())
+
+    def do_stats(self, line):
+        '''Shows statistics of the last search'''
+        if self.reversi.stats is None:
+            print('No search has been run yet')
+            return
+        print(self.reversi.stats.report())
+
     def do_ai(self, line):
         '''Set the maximum time (seconds) allowed for the AI to think'''
         if not self._is_number(line) or (float(line) < 1.0):
@@ -114,9 +153,7 @@ class ReversiCMD(Cmd):
             return False
 
     def get_last_computer_move(self):
-        move = self.reversi.board.last
-        move = (LET_LST[move[0] - 1], move[1])
-        return move
+        return tile_name(self.reversi.board.last)
 
     def print_board(self):
         print('')
@@ -125,23 +162,16 @@ class ReversiCMD(Cmd):
     def print_info(self,  move, player):
         turn_time = 0
         if player is BLACK:
-            print('Your move was {}{}'.format(move[0], move[1]))
+            print('Your move was {}'.format(move))
             turn_time = self.reversi.black_last
         elif player is WHITE:
-            print("The computer's move was {}{}".format(move[0], move[1]))
+            print("The computer's move was {}".format(move))
             turn_time = self.reversi.white_last
 
         print('Move took {:.3f}s'.format(turn_time))
         score = self.reversi.score
         print('Score is (black/white): {}/{}\n'.format(score[BLACK], score[WHITE]))
 
-    def contains(self, line, items):
-        for i in items:
-            if str(i) in line:
-                return i
-
-        return False
-
     def print_end_game(self):
         score = self.reversi.score
         winner = 'Nobody - Draw'
@@ -155,8 +185,13 @@ class ReversiCMD(Cmd):
               .format(self.reversi.black_time, self.reversi.white_time))
         print('Score (black/white): {}/{}'.format(score[BLACK], score[WHITE]))
         print('Winner: {}'.format(winner))
+        if self.reversi.ponder:
+            print(self.reversi.ponder_report())
 
 
 if __name__ == '__main__':
-    reversi = Reversi()
+    if len(sys.argv) > 1:
+        reversi = Reversi(BitBoard, size=int(sys.argv[1]))
+    else:
+        reversi = Reversi()
     ReversiCMD(reversi).cmdloop()
@@ -14,9 +14,35 @@ CUTOFF_MARGIN = 0.3
 # GUI
 TILE_SIZE      = 32                     # Tiles used as base to build board
 ICON_SIZE      = TILE_SIZE // 2
-DISPLAY_WIDTH  = 12 * TILE_SIZE         # Display is wider than board
-DISPLAY_HEIGHT = 10 * TILE_SIZE
+DISPLAY_WIDTH  = (BOARD_SIZE + 4) * TILE_SIZE  # Display is wider than board
+DISPLAY_HEIGHT = (BOARD_SIZE + 2) * TILE_SIZE
 GLOBAL_OFFSET  = TILE_SIZE              # Offset to include boarder around board
 FONT_SIZE      = TILE_SIZE // 2
-SCORE_POS_X    = 9 * TILE_SIZE
+SCORE_POS_X    = (BOARD_SIZE + 1) * TILE_SIZE
 SCORE_POS_Y    = 1 * TILE_SIZE
+GLYPH_CACHE    = 256                    # Rendered texts kept by the GUI
+
+# Search
+TT_MEMORY         = 16 * 1024 * 1024    # Transposition table size in bytes,
+                                        # shared by all parallel workers
+TT_POLICY         = 'depth'             # Replacement policy: depth/always
+ASPIRATION_WINDOW = 50                  # Half width of the aspiration window
+NODE_LIMIT        = None                # Most nodes per move, None: no limit
+ENDGAME_EMPTIES   = 10                  # Solve exactly from this many empties
+
+# Opening book
+BOOK_FILE  = 'book.bin'
+BOOK_PLIES = 6                          # Book covers the first plies moves
+BOOK_DEPTH = 6                          # Search depth of the book positions
+
+# Game server
+SERVER_HOST   = '127.0.0.1'
+SERVER_PORT   = 7770
+SERVER_BUDGET = 1.0                     # Default search time per move
+SERVER_LIMIT  = 10.0                    # Longest search time allowed
+SERVER_DEPTH  = 12                      # Deepest fixed depth search allowed
+SERVER_QUEUE  = 64                      # Searches waiting before busy replies
+
+# Game records
+RECORD_FILE  = 'games.rvg'
+RECORD_BLOCK = 1024                     # Records written per block
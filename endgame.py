@@ -0,0 +1,389 @@
+#! /usr/bin/env python
+# title           :endgame.py
+# description     :An exact endgame solver for Reversi
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python endgame.py [empties] [positions] [file]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, EMPTY, BOARD_SIZE, ENDGAME_EMPTIES
+import bitboard as bb
+import random
+import sys
+from time import time
+
+popcount = bb.popcount
+
+# Above this many empties moves are sorted by the opponent's mobility
+# (fastest first). Below it, the cheaper parity order is used on its own.
+FASTEST_FIRST = 7
+
+# Nodes searched between calls to the stop function given to solve
+CHECK_NODES = 1000
+
+CHARS = {BLACK: 'X', WHITE: 'O', EMPTY: '-'}
+
+
+def to_string(board):
+    '''Returns the position as a line of text: one character per square,
+       column by column, followed by a space and the player to move.
+       X is black, O is white and - is empty.
+    '''
+
+    cells = []
+    for col in range(1, board.size + 1):
+        for row in range(1, board.size + 1):
+            cells.append(CHARS[board.get_tile((col, row))])
+    return ''.join(cells) + ' ' + CHARS[board.turn]
+
+
+def from_string(text, board_class=bb.BitBoard):
+    '''Returns a board set up from a line written by to_string'''
+
+    cells, turn = text.split()
+    size = int(len(cells) ** 0.5)
+    if size * size != len(cells) or turn not in (CHARS[BLACK], CHARS[WHITE]):
+        raise ValueError('Not a position: {}'.format(text))
+
+    black, white = 0, 0
+    for i, c in enumerate(cells):
+        if c == CHARS[BLACK]:
+            black |= 1 << i
+        elif c == CHARS[WHITE]:
+            white |= 1 << i
+        elif c != CHARS[EMPTY]:
+            raise ValueError('Not a position: {}'.format(text))
+
+    board = board_class(size)
+    board.set_position(black, white, BLACK if turn == CHARS[BLACK] else WHITE)
+    return board
+
+
+def parity_regions(size):
+    '''Returns the bitmasks of the four quadrants of the board, which are
+       the regions used for parity ordering.
+    '''
+
+    half    = size // 2
+    regions = [0, 0, 0, 0]
+    for col in range(size):
+        for row in range(size):
+            q = 2 * (col >= half) + (row >= half)
+            regions[q] |= 1 << (col * size + row)
+    return regions
+
+
+class EndgameSolver(object):
+    '''
+        Solves Reversi positions exactly, by searching every line to the end
+        of the game. The value of a position is the final disc differential
+        for the player to move.
+
+        Works on plain (own, opponent) bitboards from board.encode, so it can
+        solve both ReversiBoard and BitBoard positions. Moves are ordered
+        fastest first, i.e. by how few replies they leave the opponent, and by
+        parity: moves in a quadrant with an odd number of empty squares come
+        first. The last three empty squares are handled by dedicated routines
+        that skip the full move generation.
+
+        Can be used as the solver of a Reversi instance, which then uses it
+        once there are no more than empties empty squares left.
+    '''
+
+    def __init__(self, size=BOARD_SIZE, empties=ENDGAME_EMPTIES):
+        self.size    = size
+        self.empties = empties
+        self.full    = (1 << (size * size)) - 1
+        self.shifts  = list(bb.shift_table(size).values())
+        self.span    = size - 3
+        self.regions = parity_regions(size)
+        self.nodes   = 0
+        self.stop    = None
+        self.check   = CHECK_NODES
+
+    def solve(self, board, exact=True, stop=None):
+        '''Solves the position on board. Returns a tuple of (value, move),
+           where value is the final disc differential for the player to move
+           and move the best tile, or None if the player has to pass.
+
+           If exact is False, only a win, draw or loss is proven, and the
+           value is the sign of the result. This is a lot faster.
+
+           stop, if given, is called every CHECK_NODES nodes, and can end the
+           solve early by raising an exception, which is passed on.
+        '''
+
+        self.stop  = stop
+        self.check = CHECK_NODES
+        try:
+            return self.solve_root(board, exact)
+        finally:
+            self.stop = None
+
+    def solve_root(self, board, exact):
+        '''Searches the moves of board for solve'''
+
+        black, white, turn = board.encode()
+        own, opp = (black, white) if turn is BLACK else (white, black)
+        empty    = ~(own | opp) & self.full
+        alpha, beta = (-self.size ** 2, self.size ** 2) if exact else (-1, 1)
+
+        best, v = None, -self.size ** 2 - 1
+        moves = self.moves(own, opp)
+        if not moves:
+            v = -self.search(opp, own, -beta, -alpha, empty, True)
+        for bit in self.ordered(own, opp, moves, empty):
+            flips = self.flips(own, opp, bit)
+            score = -self.search(opp & ~flips, own | flips | bit,
+                                 -beta, -alpha, empty & ~bit, False)
+            if score > v:
+                v, best = score, bit
+            if v >= beta:
+                break
+            alpha = max(alpha, v)
+
+        if not exact:
+            v = (v > 0) - (v < 0)
+        if best is None:
+            return v, None
+        return v, bb.bit_tile(best.bit_length() - 1, self.size)
+
+    def moves(self, own, opp):
+        '''Returns a bitboard of the legal moves for own'''
+
+        empty = ~(own | opp) & self.full
+        span  = self.span
+        moves = 0
+        for s, mask in self.shifts:
+            if s > 0:
+                x = (own << s) & mask & opp
+                for _ in range(span):
+                    x |= (x << s) & mask & opp
+                moves |= (x << s) & mask & empty
+            else:
+                s = -s
+                x = (own >> s) & mask & opp
+                for _ in range(span):
+                    x |= (x >> s) & mask & opp
+                moves |= (x >> s) & mask & empty
+        return moves
+
+    def flips(self, own, opp, bit):
+        '''Returns the discs flipped when own plays bit, 0 if it is not a
+           legal move.
+        '''
+
+        flips = 0
+        for s, mask in self.shifts:
+            run = 0
+            if s > 0:
+                step = (bit << s) & mask
+                while step & opp:
+                    run |= step
+                    step = (step << s) & mask
+            else:
+                step = (bit >> -s) & mask
+                while step & opp:
+                    run |= step
+                    step = (step >> -s) & mask
+            if step & own:
+                flips |= run
+        return flips
+
+    def final(self, own, opp):
+        '''Returns the disc differential of a finished game'''
+        return popcount(own) - popcount(opp)
+
+    def ordered(self, own, opp, moves, empty):
+        '''Returns the move bits of moves, best first for the search'''
+
+        odd = 0
+        for region in self.regions:
+            if popcount(empty & region) & 1:
+                odd |= region
+
+        bits = []
+        while moves:
+            bit = moves & -moves
+            bits.append(bit)
+            moves ^= bit
+
+        if popcount(empty) > FASTEST_FIRST:
+            def key(bit):
+                flips = self.flips(own, opp, bit)
+                reply = self.moves(opp & ~flips, own | flips | bit)
+                return (popcount(reply), not bit & odd)
+        else:
+            def key(bit):
+                return not bit & odd
+
+        bits.sort(key=key)
+        return bits
+
+    def search(self, own, opp, alpha, beta, empty, passed):
+        '''Returns the value of the position for own, searched to the end of
+           the game within the (alpha, beta) window. passed is True if the
+           other player just passed.
+        '''
+
+        self.nodes += 1
+        self.check -= 1
+        if self.check <= 0:
+            self.check = CHECK_NODES
+            if self.stop is not None:
+                self.stop()
+
+        count = popcount(empty)
+        if count == 1:
+            return self.last1(own, opp, empty)
+        if count == 2:
+            return self.last2(own, opp, alpha, beta, empty)
+        if count == 3:
+            return self.last3(own, opp, alpha, beta, empty)
+
+        moves = self.moves(own, opp)
+        if not moves:
+            if passed:
+                return self.final(own, opp)
+            return -self.search(opp, own, -beta, -alpha, empty, True)
+
+        v = -self.size ** 2 - 1
+        for bit in self.ordered(own, opp, moves, empty):
+            flips = self.flips(own, opp, bit)
+            score = -self.search(opp & ~flips, own | flips | bit,
+                                 -beta, -alpha, empty & ~bit, False)
+            if score > v:
+                v = score
+                if v >= beta:
+                    break
+                alpha = max(alpha, v)
+        return v
+
+    def last1(self, own, opp, bit):
+        '''Value of a position with one empty square, bit'''
+
+        self.nodes += 1
+        flips = self.flips(own, opp, bit)
+        if flips:
+            n = popcount(flips)
+            return popcount(own) - popcount(opp) + 2 * n + 1
+        flips = self.flips(opp, own, bit)
+        if flips:
+            n = popcount(flips)
+            return popcount(own) - popcount(opp) - 2 * n - 1
+        return popcount(own) - popcount(opp)
+
+    def last2(self, own, opp, alpha, beta, empty, passed=False):
+        '''Value of a position with two empty squares'''
+
+        self.nodes += 1
+        first  = empty & -empty
+        second = empty ^ first
+
+        v = None
+        for bit, rest in ((first, second), (second, first)):
+            flips = self.flips(own, opp, bit)
+            if flips:
+                score = -self.last1(opp & ~flips, own | flips | bit, rest)
+                if v is None or score > v:
+                    v = score
+                    if v >= beta:
+                        break
+
+        if v is not None:
+            return v
+        if passed:
+            return self.final(own, opp)
+        return -self.last2(opp, own, -beta, -alpha, empty, True)
+
+    def last3(self, own, opp, alpha, beta, empty, passed=False):
+        '''Value of a position with three empty squares. A square that is
+           alone in its quadrant is tried first.
+        '''
+
+        self.nodes += 1
+        squares = []
+        rest    = empty
+        while rest:
+            bit = rest & -rest
+            squares.append(bit)
+            rest ^= bit
+        squares.sort(key=lambda bit: not any(
+            bit & r and popcount(empty & r) == 1 for r in self.regions))
+
+        v = None
+        for bit in squares:
+            flips = self.flips(own, opp, bit)
+            if flips:
+                score = -self.last2(opp & ~flips, own | flips | bit,
+                                    -beta, -alpha, empty & ~bit)
+                if v is None or score > v:
+                    v = score
+                    if v >= beta:
+                        break
+                    alpha = max(alpha, v)
+
+        if v is not None:
+            return v
+        if passed:
+            return self.final(own, opp)
+        return -self.last3(opp, own, -beta, -alpha, empty, True)
+
+
+def endgame_positions(empties, count, size=BOARD_SIZE, seed=0):
+    '''Generates count positions with the given number of empty squares, by
+       random play from the start position. The same seed always gives the
+       same positions. Returns a list of BitBoards.
+    '''
+
+    rng       = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = bb.BitBoard(size)
+        while board.empties > empties:
+            moves = board.valid_moves()
+            if moves == []:
+                board.switch_turns()
+                moves = board.valid_moves()
+                if moves == []:
+                    break
+            board.do_move(rng.choice(moves))
+        if board.empties == empties and board.valid_moves() != []:
+            positions.append(board)
+    return positions
+
+
+def benchmark(positions, solver=None):
+    '''Solves every position and prints the value, best move, nodes and time
+       to solve. Returns the total time.
+    '''
+
+    if solver is None:
+        solver = EndgameSolver(positions[0].size)
+    total = 0.0
+    nodes = 0
+    for i, board in enumerate(positions):
+        solver.nodes = 0
+        start = time()
+        value, move = solver.solve(board)
+        spent = time() - start
+        total += spent
+        nodes += solver.nodes
+        print('{:3d} {} {:+3d} {} {:9d} nodes {:8.3f}s'.format(
+            i + 1, to_string(board), value, move, solver.nodes, spent))
+
+    print('Solved {} positions in {:.3f}s, {:.0f} nodes/s'.format(
+        len(positions), total, nodes / total if total else 0))
+    return total
+
+
+if __name__ == '__main__':
+    empties = int(sys.argv[1]) if len(sys.argv) > 1 else ENDGAME_EMPTIES
+    count   = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    if len(sys.argv) > 3:
+        with open(sys.argv[3]) as f:
+            positions = [from_string(line) for line in f if line.strip()]
+    else:
+        positions = endgame_positions(empties, count)
+    benchmark(positions)
@@ -9,6 +9,8 @@
 
 from constants import BLACK, WHITE, DISPLAY_HEIGHT, DISPLAY_WIDTH, GLOBAL_OFFSET
 from constants import SCORE_POS_X, SCORE_POS_Y, TILE_SIZE, FONT_SIZE, ICON_SIZE
+from constants import GLYPH_CACHE
+from string import ascii_lowercase
 import pygame
 from reversi import Reversi
 
@@ -21,14 +23,29 @@ TILES   = pygame.image.load('marble.png')
 MOVES   = pygame.image.load('icons.png')
 DISPLAY = pygame.display.set_mode((DISPLAY_WIDTH, DISPLAY_HEIGHT))
 
+# Rendering caches: fonts by size, rendered text by (text, color, size), the
+# board with its frame and labels by (cols, rows), and what every region of
+# the screen showed after the last frame
+_fonts       = {}
+_glyphs      = {}
+_backgrounds = {}
+_shown       = {}
+
 
 def run_game():
     pygame.init()
     pygame.display.set_caption('Reversi')
 
-    clock     = pygame.time.Clock()
-    game_over = False
-    game      = Reversi()
+    clock      = pygame.time.Clock()
+    game_over  = False
+    show_stats = False
+    game       = Reversi()
+
+    # Search in the background so the window keeps drawing and taking input
+    # while the computer is thinking, and think on the player's time too
+    game.background    = True
+    game.ponder        = True
+    game.collect_stats = True
 
     while not game_over:
         game.update()
@@ -37,26 +54,148 @@ def run_game():
                 game_over = True
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 get_input(game)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                show_stats = not show_stats
 
-        draw(game)
+        draw(game, show_stats)
         clock.tick(60)
         game_over = game_over or game.game_over
 
+    game.cancel_search()
     end_game(game)
     quit()
 
 
-def draw(game):
-    draw_board(game.board.size, game.board.size)
+def draw(game, show_stats=False):
+    # Only the regions that changed since the last frame are drawn again,
+    # on top of the cached board, and only they are updated on the screen.
+    # The first frame, a new layout and the statistics, which cover the
+    # board, redraw everything.
+    global _shown
+    shown = frame_state(game, show_stats)
+    if shown == _shown:
+        return
+    if not _shown or show_stats or shown['stats'] != _shown['stats'] or \
+            shown['layout'] != _shown['layout']:
+        redraw(game, show_stats)
+        return
+
+    dirty = []
+    for name, key in shown.items():
+        if _shown.get(name) != key:
+            dirty.append(draw_region(game, name, key))
+    _shown = shown
+    pygame.display.update(dirty)
+
+
+def redraw(game, show_stats=False):
+    # Draws the whole screen and updates all of it
+    global _shown
+    size = game.board.size
+    DISPLAY.blit(board_surface(size, size), (0, 0))
     draw_pieces(game)
     draw_score(game)
     if game.board.turn is BLACK:
         draw_moves(game)
     draw_button(game)
     draw_working(game)
+    if show_stats:
+        draw_stats(game)
+    _shown = frame_state(game, show_stats)
     pygame.display.update()
 
 
+def frame_state(game, show_stats):
+    # What every region of the screen should show, as {region: key}. A
+    # region is drawn again when its key changes.
+    state   = game.board
+    board   = state.board
+    moves   = state.valid_moves() if state.turn is BLACK else []
+    optimal = game.get_optimal_move() if game.hints else None
+
+    shown = {}
+    for i in range(state.size):
+        for j in range(state.size):
+            tile   = (i + 1, j + 1)
+            marker = None
+            if tile in moves:
+                marker = 'optimal' if tile == optimal else 'move'
+            shown[tile] = (board[i][j], marker)
+
+    shown['score']   = (game.score[BLACK], game.score[WHITE])
+    shown['button']  = game.hints
+    shown['working'] = state.turn
+    shown['stats']   = id(game.stats) if show_stats else None
+    shown['layout']  = (state.size, id(DISPLAY), DISPLAY.get_size())
+    return shown
+
+
+def region_rect(name):
+    # The area of the screen taken up by a region of frame_state
+    if name == 'score':
+        x = SCORE_POS_X + GLOBAL_OFFSET
+        return pygame.Rect(x, SCORE_POS_Y + GLOBAL_OFFSET,
+                           DISPLAY_WIDTH - x, 2 * TILE_SIZE)
+    if name == 'button':
+        return pygame.Rect(SCORE_POS_X + TILE_SIZE // 4 + GLOBAL_OFFSET,
+                           SCORE_POS_Y - TILE_SIZE + GLOBAL_OFFSET,
+                           ICON_SIZE, ICON_SIZE)
+    if name == 'working':
+        return pygame.Rect(SCORE_POS_X - 3 * ICON_SIZE // 2 + GLOBAL_OFFSET,
+                           SCORE_POS_Y + ICON_SIZE // 2 + GLOBAL_OFFSET,
+                           ICON_SIZE, 3 * ICON_SIZE)
+    col, row = name
+    return pygame.Rect((col - 1) * TILE_SIZE + GLOBAL_OFFSET,
+                       (row - 1) * TILE_SIZE + GLOBAL_OFFSET,
+                       TILE_SIZE, TILE_SIZE)
+
+
+def draw_region(game, name, key):
+    # Draws one region of frame_state over the cached board, and returns
+    # its area
+    size = game.board.size
+    rect = region_rect(name)
+    DISPLAY.blit(board_surface(size, size), rect, rect)
+    if name == 'score':
+        draw_score(game)
+    elif name == 'button':
+        draw_button(game)
+    elif name == 'working':
+        draw_working(game)
+    else:
+        value, marker = key
+        x, y = (name[0] - 1) * TILE_SIZE, (name[1] - 1) * TILE_SIZE
+        if value is WHITE:
+            draw_piece(x, y, 'white')
+        elif value is BLACK:
+            draw_piece(x, y, 'black')
+        if marker is not None:
+            draw_move(x, y, marker == 'optimal')
+    return rect
+
+
+def board_surface(cols, rows):
+    # The board, its frame and the labels, drawn once and then kept
+    surface = _backgrounds.get((cols, rows))
+    if surface is None:
+        surface = pygame.Surface(DISPLAY.get_size()).convert()
+        draw_board(cols, rows, surface)
+        _backgrounds[(cols, rows)] = surface
+    return surface
+
+
+def draw_stats(game):
+    # Statistics of the last search, over the board. Toggled with the s key
+    lines = game.stats.lines() if game.stats else ['No search yet']
+    shade = pygame.Surface((game.board.size * TILE_SIZE,
+                            (len(lines) + 1) * FONT_SIZE), pygame.SRCALPHA)
+    shade.fill((0, 0, 0, 180))
+    DISPLAY.blit(shade, (GLOBAL_OFFSET, GLOBAL_OFFSET))
+    for i, line in enumerate(lines):
+        draw_text(line, (FONT_SIZE // 4, FONT_SIZE // 2 + i * FONT_SIZE),
+                  (255, 255, 255), FONT_SIZE - 4)
+
+
 def end_game(game):
     score = game.score
     winner = 'Black' if (score[BLACK] > score[WHITE]) else 'White'
@@ -66,6 +205,7 @@ def end_game(game):
     print('Game over!')
     print('Score (black/white): {}/{}'.format(score[BLACK], score[WHITE]))
     print('Winner is: {}'.format(winner))
+    print(game.ponder_report())
     pygame.time.wait(1500)
     pygame.quit()
 
@@ -106,13 +246,32 @@ def draw_score(game):
     draw_piece(SCORE_POS_X, SCORE_POS_Y + TILE_SIZE, 'white')
 
 
-def draw_text(text, pos, color=(0, 0, 0)):
+def draw_text(text, pos, color=(0, 0, 0), size=FONT_SIZE, target=None):
     pos = (pos[0] + GLOBAL_OFFSET, pos[1] + GLOBAL_OFFSET)
-    font = pygame.font.Font('freesansbold.ttf', FONT_SIZE)
-    surface = font.render(text, True, color)
+    surface = render_text(text, color, size)
     rect = surface.get_rect()
     rect.topleft = (pos)
-    DISPLAY.blit(surface, rect)
+    (target or DISPLAY).blit(surface, rect)
+
+
+def get_font(size):
+    # Fonts are loaded once per size
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = pygame.font.Font('freesansbold.ttf', size)
+    return font
+
+
+def render_text(text, color, size):
+    # Rendered text is kept, as the same digits and labels are drawn over
+    # and over. The cache is emptied once it holds GLYPH_CACHE texts.
+    key = (text, color, size)
+    surface = _glyphs.get(key)
+    if surface is None:
+        if len(_glyphs) >= GLYPH_CACHE:
+            _glyphs.clear()
+        surface = _glyphs[key] = get_font(size).render(text, True, color)
+    return surface
 
 
 def get_input(game):
@@ -123,26 +282,27 @@ def get_input(game):
     col = (int(pos[0]) - GLOBAL_OFFSET) // TILE_SIZE + 1
 
     if click[0] == 1:
-        if not hint_button(game, col, row):
+        if not hint_button(game, col, row) and game.board.turn is BLACK:
             game.try_move((col, row))
-    elif click[2] == 1:
-        game.alpha_beta_search()
+    elif click[2] == 1 and game.board.turn is BLACK:
+        game.start_search()
 
 
 def hint_button(game, col, row):
-    if col == 10 and row == 1:
+    if col == game.size + 2 and row == 1:
         game.hints = not game.hints
-        if game.hints:
-            game.alpha_beta_search()
+        if game.hints and game.board.turn is BLACK:
+            game.start_search()
         return True
     return False
 
 
 def draw_pieces(game):
     state = game.board
+    board = state.board
     for i in range(state.size):
         for j in range(state.size):
-            value = state.board[i][j]
+            value = board[i][j]
             if value is 'O':
                 draw_piece(i * TILE_SIZE, j * TILE_SIZE, 'white')
             elif value is 'X':
@@ -159,7 +319,7 @@ def draw_moves(game):
             draw_move((m[0] - 1) * TILE_SIZE, (m[1] - 1) * TILE_SIZE)
 
 
-def draw_tile(posx, posy, t_type):
+def draw_tile(posx, posy, t_type, target=None):
     posx += GLOBAL_OFFSET
     posy += GLOBAL_OFFSET
     borders = {
@@ -170,22 +330,23 @@ def draw_tile(posx, posy, t_type):
         'border_middle':     (2, 1)
     }
 
+    target = target or DISPLAY
     if t_type is 'dark':
-        DISPLAY.blit(TILES, (posx, posy), (0, TILE_SIZE, TILE_SIZE, TILE_SIZE))
+        target.blit(TILES, (posx, posy), (0, TILE_SIZE, TILE_SIZE, TILE_SIZE))
     elif t_type is 'light':
-        DISPLAY.blit(TILES, (posx, posy), (0, 0, TILE_SIZE, TILE_SIZE))
+        target.blit(TILES, (posx, posy), (0, 0, TILE_SIZE, TILE_SIZE))
     elif t_type in borders:
-        blit_tile(borders[t_type], (posx, posy))
+        blit_tile(borders[t_type], (posx, posy), target)
 
 
-def blit_tile(offset, pos):
+def blit_tile(offset, pos, target=None):
     img_pos = (
         offset[0] * TILE_SIZE,
         offset[1] * TILE_SIZE,
         TILE_SIZE, TILE_SIZE
         )
 
-    DISPLAY.blit(TILES, pos, img_pos)
+    (target or DISPLAY).blit(TILES, pos, img_pos)
 
 
 def draw_piece(posx, posy, color):
@@ -210,41 +371,43 @@ def draw_move(posx, posy, is_optimal=False):
                      (ICON_SIZE, 2 * ICON_SIZE, ICON_SIZE, ICON_SIZE))
 
 
-def draw_board(cols, rows):
+def draw_board(cols, rows, target=None):
     # Draw the board itself
     for i in range(cols):
         for j in range(rows):
             t_type = 'light' if (i+j) % 2 == 0 else 'dark'
-            draw_tile(TILE_SIZE * i, TILE_SIZE * j, t_type)
+            draw_tile(TILE_SIZE * i, TILE_SIZE * j, t_type, target)
 
     # Draw a frame around the board. First the corners, then the sides
-    draw_tile(TILE_SIZE * -1, TILE_SIZE * -1, 'border_topleft')
-    draw_tile(TILE_SIZE * cols, TILE_SIZE * -1, 'border_topright')
-    draw_tile(TILE_SIZE * -1, TILE_SIZE * rows, 'border_bottomleft')
-    draw_tile(TILE_SIZE * cols, TILE_SIZE * rows, 'border_bottomright')
+    draw_tile(TILE_SIZE * -1, TILE_SIZE * -1, 'border_topleft', target)
+    draw_tile(TILE_SIZE * cols, TILE_SIZE * -1, 'border_topright', target)
+    draw_tile(TILE_SIZE * -1, TILE_SIZE * rows, 'border_bottomleft', target)
+    draw_tile(TILE_SIZE * cols, TILE_SIZE * rows, 'border_bottomright',
+              target)
 
     for i in range(rows):
-        draw_tile(TILE_SIZE * i, TILE_SIZE * -1, 'border_top')
-        draw_tile(TILE_SIZE * i, TILE_SIZE * rows, 'border_bottom')
+        draw_tile(TILE_SIZE * i, TILE_SIZE * -1, 'border_top', target)
+        draw_tile(TILE_SIZE * i, TILE_SIZE * rows, 'border_bottom', target)
 
     for j in range(cols):
-        draw_tile(TILE_SIZE * -1, TILE_SIZE * j, 'border_left')
-        draw_tile(TILE_SIZE * cols, TILE_SIZE * j, 'border_right')
+        draw_tile(TILE_SIZE * -1, TILE_SIZE * j, 'border_left', target)
+        draw_tile(TILE_SIZE * cols, TILE_SIZE * j, 'border_right', target)
 
     # Some extra background space for score etc
     for i in range(-1, rows + 1):
-        draw_tile(TILE_SIZE * (cols + 1), TILE_SIZE * i, 'border_middle')
-        draw_tile(TILE_SIZE * (cols + 2), TILE_SIZE * i, 'border_middle')
+        for k in (cols + 1, cols + 2):
+            draw_tile(TILE_SIZE * k, TILE_SIZE * i, 'border_middle', target)
 
     # Add numbering for board
-    abc = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
     offset = FONT_SIZE // 2
 
     for i in range(rows):
-        draw_text(abc[i], (TILE_SIZE * i + offset, -1 * TILE_SIZE + offset))
+        draw_text(ascii_lowercase[i], (TILE_SIZE * i + offset, -1 * TILE_SIZE + offset),
+                  target=target)
 
     for j in range(cols):
-        draw_text(str(j + 1), (TILE_SIZE * -1 + offset, j * TILE_SIZE + offset))
+        draw_text(str(j + 1), (TILE_SIZE * -1 + offset, j * TILE_SIZE + offset),
+                  target=target)
 
 if __name__ == '__main__':
     run_game()
@@ -0,0 +1,125 @@
+#! /usr/bin/env python
+# title           :guibench.py
+# description     :Measures GUI frame times without a window
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python guibench.py [--frames N] [--every N] [--check]
+# python_version  :3.5.2
+# =============================================================================
+
+import os
+
+# Render to memory only. Must be set before gui sets up the display.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from reversi import Reversi
+import argparse
+import gui
+import pygame
+import random
+from time import time
+
+MODES = ['uncached', 'full', 'dirty']
+
+
+def draw_frame(game, mode):
+    '''Draws one frame the way mode says: dirty draws only what changed,
+       full draws the whole screen from the caches, and uncached empties the
+       caches first, like every frame did before they were added.
+    '''
+
+    if mode == 'dirty':
+        gui.draw(game)
+        return
+    if mode == 'uncached':
+        gui._fonts.clear()
+        gui._glyphs.clear()
+        gui._backgrounds.clear()
+    gui.redraw(game)
+
+
+def new_game():
+    '''Returns a new game showing hints, on a blank screen'''
+    game = Reversi()
+    game.book  = None
+    game.hints = True
+    gui._shown = {}
+    gui.DISPLAY.fill((0, 0, 0))
+    return game
+
+
+def play(game, frames, every, seed=0):
+    '''Yields the game frames times, playing a random move every every frames.
+       A new game is started when one ends.
+    '''
+
+    rng = random.Random(seed)
+    for frame in range(frames):
+        if frame % every == every - 1:
+            moves = game.board.valid_moves()
+            if moves == []:
+                game.board.switch_turns()
+                moves = game.board.valid_moves()
+            if moves == []:
+                game = new_game()
+            else:
+                game.board.do_move(rng.choice(moves))
+        yield game
+
+
+def run(mode, frames, every, seed=0):
+    '''Draws frames frames of a game of random moves, with a move every
+       every frames. Returns the frame times in seconds.
+    '''
+
+    times = []
+    for game in play(new_game(), frames, every, seed):
+        start = time()
+        draw_frame(game, mode)
+        times.append(time() - start)
+    return times
+
+
+def check(frames, every, seed=0):
+    '''Draws frames frames like run does in dirty mode, and compares the
+       screen after every frame with a full redraw of it. Returns the number
+       of frames that differ.
+    '''
+
+    wrong = 0
+    for game in play(new_game(), frames, every, seed):
+        gui.draw(game)
+        drawn = gui.DISPLAY.copy()
+        gui.redraw(game)
+        if pygame.image.tostring(drawn, 'RGB') != \
+                pygame.image.tostring(gui.DISPLAY, 'RGB'):
+            wrong += 1
+        # Go on from the dirty frame, so mistakes add up as they would
+        gui.DISPLAY.blit(drawn, (0, 0))
+    return wrong
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measures GUI frame times under the SDL dummy driver')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--every', type=int, default=30,
+                        help='frames between moves')
+    parser.add_argument('--check', action='store_true',
+                        help='compare dirty frames with full redraws')
+    args = parser.parse_args()
+
+    pygame.init()
+    if args.check:
+        wrong = check(args.frames, args.every)
+        print('{} of {} frames differ from a full redraw'.format(
+            wrong, args.frames))
+        pygame.quit()
+        raise SystemExit(1 if wrong else 0)
+    for mode in MODES:
+        times = sorted(run(mode, args.frames, args.every))
+        print('{:8s}  mean {:7.3f}ms  p50 {:7.3f}ms  p99 {:7.3f}ms'.format(
+            mode, 1000 * sum(times) / len(times),
+            1000 * times[len(times) // 2], 1000 * times[len(times) * 99 //
+                                                        100]))
+    pygame.quit()
@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+# title           :loadgen.py
+# description     :Plays many games against server.py to measure throughput
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python loadgen.py [--clients N] [--games N] [--depth N]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import SERVER_HOST, SERVER_PORT
+from server import percentiles
+import argparse
+import asyncio
+import json
+from time import time
+
+BUSY_WAIT = 0.05                # Seconds to wait before sending a busy request
+
+
+class Client(object):
+    '''A connection to the game server, sending one request at a time'''
+
+    def __init__(self, reader, writer):
+        self.reader    = reader
+        self.writer    = writer
+        self.latencies = []
+        self.busy      = 0
+
+    async def request(self, **request):
+        '''Sends a request and returns the reply. Busy replies are retried.'''
+        while True:
+            start = time()
+            self.writer.write((json.dumps(request) + '\n').encode())
+            await self.writer.drain()
+            reply = json.loads((await self.reader.readline()).decode())
+            if reply.get('error') != 'busy':
+                break
+            self.busy += 1
+            await asyncio.sleep(BUSY_WAIT)
+
+        if request['cmd'] == 'think':
+            self.latencies.append(time() - start)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def close(self):
+        self.writer.close()
+
+
+async def connect(args):
+    '''Opens a connection to the server given on the command line'''
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    return Client(reader, writer)
+
+
+async def play_games(args, totals):
+    '''Plays games with the engine on both sides over one connection'''
+
+    client = await connect(args)
+    for _ in range(args.games):
+        state = await client.request(cmd='new')
+        sid   = state['session']
+        while not state['game_over']:
+            if args.depth:
+                state = await client.request(cmd='think', session=sid,
+                                             depth=args.depth)
+            else:
+                state = await client.request(cmd='think', session=sid,
+                                             time=args.time)
+            totals['moves'] += 1
+        await client.request(cmd='close', session=sid)
+        totals['games'] += 1
+
+    client.close()
+    return client
+
+
+async def run(args):
+    '''Runs every client at once and prints the results'''
+
+    totals  = {'moves': 0, 'games': 0}
+    start   = time()
+    clients = await asyncio.gather(*[play_games(args, totals)
+                                     for _ in range(args.clients)])
+    spent   = time() - start
+
+    latencies = [t for c in clients for t in c.latencies]
+    p = percentiles(latencies)
+    print('{} games, {} engine moves in {:.1f}s: {:.1f} moves/s'.format(
+        totals['games'], totals['moves'], spent, totals['moves'] / spent))
+    print('Move latency p50 {:.3f}s p90 {:.3f}s p99 {:.3f}s, '
+          '{} busy replies'.format(p[50], p[90], p[99],
+                                   sum(c.busy for c in clients)))
+
+    client = await connect(args)
+    print('Server: {}'.format(json.dumps(await client.request(cmd='stats'))))
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Plays engine games on server.py and measures throughput')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--unix', help='connect to a Unix socket instead')
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--games', type=int, default=1,
+                        help='games per client')
+    parser.add_argument('--depth', type=int, default=2,
+                        help='search depth per move, 0 to use --time')
+    parser.add_argument('--time', type=float, default=0.5,
+                        help='search time per move with --depth 0')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run(args))
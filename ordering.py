@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+# title           :ordering.py
+# description     :Move ordering heuristics for the Reversi search
+# author          :andresthor
+# date            :05-02-2017
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BOARD_SIZE
+
+KILLER_SLOTS = 2
+
+
+def square_priors(size):
+    '''Returns a dict of static square weights for a board of the given size.
+       Corners are the best squares, while the X squares (diagonally next to a
+       corner) and C squares (next to a corner on the edge) are the worst.
+    '''
+
+    priors = {}
+    last   = size - 1
+    for i in range(size):
+        for j in range(size):
+            edge_i = min(i, last - i)
+            edge_j = min(j, last - j)
+            if edge_i == 0 and edge_j == 0:
+                weight = 100
+            elif edge_i == 1 and edge_j == 1:
+                weight = -50
+            elif min(edge_i, edge_j) == 0 and max(edge_i, edge_j) == 1:
+                weight = -20
+            elif min(edge_i, edge_j) == 0:
+                weight = 10
+            elif min(edge_i, edge_j) == 1:
+                weight = -2
+            else:
+                weight = 1
+            priors[(i + 1, j + 1)] = weight
+
+    return priors
+
+
+class MoveOrderer(object):
+    '''
+        Orders the moves of a search node so that the best moves are tried
+        first, which lets alpha-beta prune far more of the tree.
+
+        The order is:
+            1. The best move from the transposition table or the principal
+               variation
+            2. Killer moves, quiet moves that caused a cutoff at the same ply
+            3. Moves by their history score, which grows every time a move
+               causes a cutoff
+            4. Static square weights, corners first and X/C squares last
+    '''
+
+    def __init__(self, size=BOARD_SIZE):
+        self.priors        = square_priors(size)
+        self.killers       = {}
+        self.history       = {}
+        self.cutoffs       = 0
+        self.first_cutoffs = 0
+
+    def new_search(self):
+        '''Prepares for a new search. Killers are only valid for one search,
+           while the history scores are aged so recent results count more.
+        '''
+        self.killers = {}
+        for key in self.history:
+            self.history[key] //= 2
+
+    def order(self, moves, ply, color, best=None):
+        '''Sorts moves in place, best first, and returns them'''
+
+        killers = self.killers.get(ply, [])
+        history = self.history
+        priors  = self.priors
+
+        def key(move):
+            if move == best:
+                return (0, 0, 0)
+            if move in killers:
+                return (1, killers.index(move), 0)
+            return (2, -history.get((color, move), 0), -priors.get(move, 0))
+
+        moves.sort(key=key)
+        return moves
+
+    def record_cutoff(self, move, ply, color, depth, index):
+        '''Updates the killer moves and history scores after move caused a
+           cutoff. index is the position of the move in the ordered list, and
+           depth the remaining search depth.
+        '''
+
+        self.cutoffs += 1
+        if index == 0:
+            self.first_cutoffs += 1
+
+        killers = self.killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[KILLER_SLOTS:]
+
+        key = (color, move)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def first_cutoff_rate(self):
+        '''Returns how often the first move tried caused the cutoff'''
+        if self.cutoffs == 0:
+            return 0.0
+        return self.first_cutoffs / self.cutoffs
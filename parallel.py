@@ -0,0 +1,259 @@
+#! /usr/bin/env python
+# title           :parallel.py
+# description     :Root parallel alpha-beta search over a process pool
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python parallel.py [depth] [workers,...]
+# python_version  :3.5.2
+# =============================================================================
+
+from reversi import Reversi, SearchTimeout, NULL_WINDOW
+from constants import TT_MEMORY
+from bitboard import BitBoard
+import transposition as tt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+import sys
+from time import time
+
+# Set up in every worker process by init_worker
+_engine = None
+_shared = None
+_stop   = None
+
+
+class WorkerEngine(Reversi):
+    '''
+        The engine of a worker process. It counts as cancelled while the
+        stop flag shared with the main process is set, see
+        ParallelSearch.cancel.
+    '''
+
+    @property
+    def cancelled(self):
+        return _stop is not None and _stop.value != 0
+
+    @cancelled.setter
+    def cancelled(self, value):
+        pass
+
+
+def init_worker(shared, stop, board_class, evaluator, size, pvs, memory):
+    '''Creates the search engine of a worker process. shared holds the best
+       exact root value found so far and the index of its move, and stop is
+       set when the search is cancelled. memory is the size of the worker's
+       transposition table in bytes.
+    '''
+    global _engine, _shared, _stop
+    _shared = shared
+    _stop   = stop
+    _engine = WorkerEngine(board_class, evaluator, size)
+    _engine.pvs      = pvs
+    _engine.tt       = tt.TranspositionTable(memory)
+    _engine.tt_exact = True
+
+
+def search_root_move(code, move, index, depth, beta, deadline):
+    '''Searches a single root move in a worker process.
+
+       The position is sent as a compact code from encode. The move is tested
+       against the best value found by any worker so far, and only searched
+       with the full window if it beats it. Returns a tuple of (index, score,
+       exact, nodes, seconds), with a score of None if the deadline passed.
+    '''
+
+    start  = time()
+    engine = _engine
+    with _shared.get_lock():
+        alpha, best = _shared[0], _shared[1]
+
+    # Moves that come before the best one in the move order win ties, just as
+    # they do in the serial search, so they must also prove equality
+    bound = alpha if index > best else alpha - NULL_WINDOW
+
+    state = engine.board
+    state.set_position(*code)
+    state.make_move(move)
+    engine.search_depth = depth
+    engine.deadline     = deadline
+    engine.nodes        = 0
+    try:
+        score = engine.search_move(state, bound, beta, 1, index == 0)
+    except SearchTimeout:
+        return index, None, False, engine.nodes, time() - start
+
+    exact = bound < score < beta
+    if exact:
+        with _shared.get_lock():
+            if score > _shared[0] or (score == _shared[0] and
+                                      index < _shared[1]):
+                _shared[0], _shared[1] = score, index
+
+    return index, score, exact, engine.nodes, time() - start
+
+
+class ParallelSearch(object):
+    '''
+        Spreads the root moves of a Reversi search over a process pool.
+
+        The first root move is searched on its own to get a good bound, and
+        the rest are then searched at the same time (young brothers wait).
+        Workers share the best value found so far, so each one can prune
+        with it. The best move is the same as a serial search with tt_exact
+        set picks at the same depth.
+
+        Attach to a game with ParallelSearch(game). The share of the
+        workers' time spent searching is kept in stats, see utilization.
+        Cancelling the game's search stops the workers too. To see how the
+        search scales with the worker count, use measure_scaling.
+
+        memory is the total size of the workers' transposition tables, split
+        evenly between them, so adding workers does not add memory.
+    '''
+
+    def __init__(self, engine, workers=None, memory=TT_MEMORY):
+        self.workers = workers or os.cpu_count() or 1
+        self.shared  = multiprocessing.Array('d', [0.0, 0.0])
+        self.stop    = multiprocessing.RawValue('b', 0)
+        self.pool    = ProcessPoolExecutor(
+            self.workers, initializer=init_worker,
+            initargs=(self.shared, self.stop, engine.board.__class__,
+                      engine.evaluator, engine.size, engine.pvs,
+                      memory // self.workers))
+        self.stats   = {'workers': self.workers, 'roots': 0, 'tasks': 0,
+                        'busy': 0.0, 'wall': 0.0, 'nodes': 0}
+        engine.parallel = self
+
+    def close(self):
+        '''Shuts the worker processes down'''
+        self.pool.shutdown()
+
+    def cancel(self):
+        '''Stops the root searches running in the workers. Called by
+           Reversi.cancel_search.
+        '''
+        self.stop.value = 1
+
+    def utilization(self):
+        '''Returns the share of the available worker time that was spent
+           searching, between 0 and 1. This is not a speedup, as the workers
+           search more nodes than a serial search would, see measure_scaling.
+        '''
+        if self.stats['wall'] == 0:
+            return 0.0
+        return self.stats['busy'] / (self.stats['wall'] * self.workers)
+
+    def report(self):
+        '''Returns a one line summary of the parallel search'''
+        return ('{} workers, {} root searches, {} nodes, utilization {:.0%}'
+                .format(self.workers, self.stats['roots'],
+                        self.stats['nodes'], self.utilization()))
+
+    def search_root(self, engine, root, alpha, beta):
+        '''Parallel version of Reversi.search_root, with the same results'''
+
+        start = time()
+        state = root.state
+        self.stop.value = 0
+        if engine.cancelled:
+            raise SearchTimeout()
+        engine.nodes += 1
+        if engine.terminal_test(state, state.turn):
+            return engine.eval(state, state.turn)
+
+        actions = engine.root_actions(state)
+        code    = state.encode()
+        with self.shared.get_lock():
+            self.shared[0], self.shared[1] = alpha, len(actions)
+
+        args    = (engine.search_depth, beta, engine.deadline)
+        results = [self.pool.submit(search_root_move, code, actions[0], 0,
+                                    *args).result()]
+        if results[0][1] is not None and results[0][1] < beta and \
+                not engine.cancelled:
+            futures = [self.pool.submit(search_root_move, code, action, i,
+                                        *args)
+                       for i, action in enumerate(actions) if i > 0]
+            for future in as_completed(futures):
+                results.append(future.result())
+
+        results.sort()
+        self.stats['roots'] += 1
+        self.stats['tasks'] += len(results)
+        self.stats['busy']  += sum(r[4] for r in results)
+        self.stats['wall']  += time() - start
+        self.stats['nodes'] += sum(r[3] for r in results)
+        engine.nodes        += sum(r[3] for r in results)
+        if any(r[1] is None for r in results):
+            raise SearchTimeout()
+        if engine.nodes >= engine.node_cap:
+            raise SearchTimeout()
+
+        # The best move is the first one, in move order, with the top value
+        v, best = -float('inf'), None
+        for index, score, exact, nodes, seconds in results:
+            if score > v:
+                v, best = score, index
+
+        # Later moves that tie with the best one would only have been bounded
+        # by the serial search, so they get no value either
+        for index, score, exact, nodes, seconds in results:
+            child = root.add_child(None, actions[index])
+            tie   = score == v and index != best
+            child.value = score if exact and not tie else None
+
+        engine.tt_save(state, 1, alpha, beta, v, actions[best])
+        return v
+
+
+def measure_scaling(positions, depth, counts, board_class=BitBoard):
+    '''Searches the encoded positions to depth with a serial engine, and
+       then with a parallel one for every worker count in counts. Every
+       search starts with an empty transposition table. Returns a list of
+       dicts of the workers (0 for serial), seconds and nodes, and the
+       speedup and efficiency: the serial time over the parallel time, and
+       the speedup per worker.
+    '''
+
+    rows = []
+    for workers in [0] + list(counts):
+        engine = Reversi(board_class)
+        engine.book         = None
+        engine.solver       = None
+        engine.time_cut     = False
+        engine.cutoff_depth = depth
+        search = ParallelSearch(engine, workers) if workers else None
+        nodes, spent = 0, 0.0
+        try:
+            for code in positions:
+                engine.tt = tt.TranspositionTable()
+                engine.board.set_position(*code)
+                start = time()
+                engine.alpha_beta_search()
+                spent += time() - start
+                nodes += engine.nodes
+        finally:
+            if search is not None:
+                search.close()
+        rows.append({'workers': workers, 'seconds': spent, 'nodes': nodes})
+
+    serial = rows[0]['seconds']
+    for row in rows:
+        row['speedup']    = serial / row['seconds'] if row['seconds'] else 0.0
+        row['efficiency'] = row['speedup'] / max(row['workers'], 1)
+    return rows
+
+
+if __name__ == '__main__':
+    from benchmark import size_positions
+
+    depth  = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    counts = [int(n) for n in sys.argv[2].split(',')] if len(sys.argv) > 2 \
+        else [1, 2, 4]
+
+    print('workers   seconds      nodes  speedup  efficiency')
+    for row in measure_scaling(size_positions(8), depth, counts):
+        print('{:>7}  {:8.2f}  {:9d}  {:7.2f}  {:10.0%}'.format(
+            row['workers'] or 'serial', row['seconds'], row['nodes'],
+            row['speedup'], row['efficiency']))
@@ -0,0 +1,286 @@
+#! /usr/bin/env python
+# title           :patterns.py
+# description     :A pattern table evaluation function for Reversi
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python patterns.py [weights file]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, EMPTY, BOARD_SIZE
+from array import array
+import struct
+import sys
+
+# Weight file layout: a header of (magic, version, board size, number of
+# groups), then for every group its number of squares followed by 3^squares
+# little-endian 16 bit weights.
+MAGIC   = b'RVPW'
+VERSION = 1
+HEADER  = struct.Struct('<4sBBB')
+
+GROUPS  = ['edge', 'diagonal', 'corner']
+
+# Longest line pattern. A table has 3^squares weights, so on larger boards
+# the edges and diagonals are read as two lines of this many squares, one
+# from each corner.
+PATTERN_LINE = 8
+
+# Default weights, used when no weight file is given
+CORNER_WEIGHT = 100
+X_WEIGHT      = -50     # Diagonally next to an empty corner
+C_WEIGHT      = -20     # Next to an empty corner on the edge
+EDGE_WEIGHT   = 10      # Other edge squares
+STABLE_WEIGHT = 15      # Per disc in a run from an owned corner
+
+
+def pattern_squares(size):
+    '''Returns the squares of every pattern as {group: [instances]}. Each
+       instance is a list of (column, row) tiles, starting in a corner so
+       that all instances of a group line up with the same weight table.
+       Lines longer than PATTERN_LINE are split, see line_instances.
+    '''
+
+    last    = size
+    corners = [(1, 1, 1, 1), (last, 1, -1, 1),
+               (1, last, 1, -1), (last, last, -1, -1)]
+
+    edges = [[(c, 1) for c in range(1, size + 1)],
+             [(c, last) for c in range(1, size + 1)],
+             [(1, r) for r in range(1, size + 1)],
+             [(last, r) for r in range(1, size + 1)]]
+
+    diagonals = [[(k, k) for k in range(1, size + 1)],
+                 [(last + 1 - k, k) for k in range(1, size + 1)]]
+
+    regions = []
+    for col, row, dc, dr in corners:
+        regions.append([(col + dc * i, row + dr * j)
+                        for j in range(3) for i in range(3)])
+
+    return {'edge': line_instances(edges), 'diagonal':
+            line_instances(diagonals), 'corner': regions}
+
+
+def line_instances(lines):
+    '''Returns the lines as they are, if they fit in PATTERN_LINE squares.
+       Longer lines are replaced by their first PATTERN_LINE squares from
+       each end, both starting in the corner.
+    '''
+    if len(lines[0]) <= PATTERN_LINE:
+        return lines
+    out = []
+    for line in lines:
+        out.append(line[:PATTERN_LINE])
+        out.append(line[::-1][:PATTERN_LINE])
+    return out
+
+
+def digits(index, length):
+    '''Returns the ternary digits of a pattern index, lowest first. 0 is an
+       empty square, 1 the player's disc and 2 the opponent's.
+    '''
+    out = []
+    for _ in range(length):
+        out.append(index % 3)
+        index //= 3
+    return out
+
+
+def sign(digit):
+    '''Returns +1 for the player's disc, -1 for the opponent's, else 0'''
+    return (0, 1, -1)[digit]
+
+
+def line_value(line, inner, whole=True):
+    '''Default value of a line of digits running from one corner to another,
+       e.g. an edge or a diagonal. inner is the weight of the squares between
+       the corners. Squares next to an empty corner are left to the corner
+       regions. If whole is False the line only starts in a corner, and
+       ends part of the way along.
+    '''
+
+    n     = len(line)
+    value = 0
+    for k, d in enumerate(line):
+        if d == 0:
+            continue
+        if k == 0 or k == n - 1 and whole:
+            weight = CORNER_WEIGHT
+        elif k == 1 and line[0] == 0 or \
+                k == n - 2 and line[-1] == 0 and whole:
+            weight = 0
+        else:
+            weight = inner
+        value += sign(d) * weight
+
+    # Discs in an unbroken run from a corner can never be flipped
+    for run in (line, line[::-1]) if whole else (line,):
+        if run[0] != 0:
+            for d in run:
+                if d != run[0]:
+                    break
+                value += sign(d) * STABLE_WEIGHT
+
+    return value
+
+
+def region_value(region):
+    '''Default value of a 3x3 corner region, given as digits in row order
+       starting from the corner.
+    '''
+
+    corner = region[0]
+    value  = sign(corner) * CORNER_WEIGHT
+    if corner == 0:
+        value += sign(region[4]) * X_WEIGHT
+        value += (sign(region[1]) + sign(region[3])) * C_WEIGHT
+    return value
+
+
+def default_weights(size=BOARD_SIZE):
+    '''Builds the default weight tables, from the square weights and corner
+       stability rules above. Returns {group: array of weights}.
+    '''
+
+    lengths = dict((g, len(p[0])) for g, p in pattern_squares(size).items())
+    whole   = size <= PATTERN_LINE
+    rules   = {'edge':     lambda line: line_value(line, EDGE_WEIGHT, whole),
+               'diagonal': lambda line: line_value(line, 0, whole),
+               'corner':   region_value}
+
+    weights = {}
+    for group in GROUPS:
+        n = lengths[group]
+        weights[group] = array('h', [rules[group](digits(i, n))
+                                     for i in range(3 ** n)])
+
+    return weights
+
+
+def save_weights(path, weights, size=BOARD_SIZE):
+    '''Writes weight tables to a compact binary file'''
+    squares = pattern_squares(size)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, size, len(GROUPS)))
+        for group in GROUPS:
+            table = array('h', weights[group])
+            if sys.byteorder != 'little':
+                table.byteswap()
+            f.write(struct.pack('<B', len(squares[group][0])))
+            f.write(table.tobytes())
+
+
+def load_weights(path, size=None):
+    '''Reads weight tables written by save_weights. Returns a tuple of
+       (board size, {group: array of weights}). Raises ValueError if the
+       tables do not fit the patterns of the file's board size, or if size
+       is given and the file is for another size.
+    '''
+
+    with open(path, 'rb') as f:
+        head = f.read(HEADER.size)
+        if len(head) < HEADER.size:
+            raise ValueError('Not a pattern weight file: {}'.format(path))
+        magic, version, file_size, count = HEADER.unpack(head)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a pattern weight file: {}'.format(path))
+        if size is not None and file_size != size:
+            raise ValueError('{} has weights for {}x{} boards, not {}x{}'
+                             .format(path, file_size, file_size, size, size))
+        if count != len(GROUPS):
+            raise ValueError('{} has {} pattern groups, not {}'.format(
+                path, count, len(GROUPS)))
+
+        squares = pattern_squares(file_size)
+        weights = {}
+        for group in GROUPS:
+            n    = len(squares[group][0])
+            head = f.read(1)
+            if head != struct.pack('<B', n):
+                raise ValueError('{} has no {} table of {} squares'.format(
+                    path, group, n))
+            data = f.read(2 * 3 ** n)
+            if len(data) != 2 * 3 ** n:
+                raise ValueError('{} is cut short in the {} table'.format(
+                    path, group))
+            table = array('h')
+            table.frombytes(data)
+            if sys.byteorder != 'little':
+                table.byteswap()
+            weights[group] = table
+
+    return file_size, weights
+
+
+class PatternEvaluator(object):
+    '''
+        Evaluates a position by summing table lookups for a set of patterns:
+        the four edges, the two main diagonals and the four 3x3 corner
+        regions. Each pattern instance is read as a ternary index into the
+        weight table of its group.
+
+        The square lists and powers of three are precomputed, so an evaluation
+        is one pass over the pattern squares with no move generation.
+        Can be used as the evaluator of a Reversi instance.
+    '''
+
+    def __init__(self, size=BOARD_SIZE, path=None):
+        if path is not None:
+            size, weights = load_weights(path, size)
+        else:
+            weights = default_weights(size)
+
+        self.size      = size
+        self.weights   = weights
+        self.instances = []
+        self.masks     = []
+        for group, instances in pattern_squares(size).items():
+            table = weights[group]
+            for tiles in instances:
+                cells = [(c - 1) * size + r - 1 for (c, r) in tiles]
+                self.instances.append((table, tuple(
+                    (i, 3 ** k) for k, i in enumerate(cells))))
+                self.masks.append((table, tuple(
+                    (1 << i, 3 ** k) for k, i in enumerate(cells))))
+
+    def evaluate(self, state, color):
+        '''Returns the value of state for color'''
+        if hasattr(state, 'bits'):
+            return self.evaluate_bits(state, color)
+
+        cells = state.cells
+        total = 0
+        for table, squares in self.instances:
+            index = 0
+            for i, p in squares:
+                value = cells[i]
+                if value is color:
+                    index += p
+                elif value is not EMPTY:
+                    index += p + p
+            total += table[index]
+
+        return total
+
+    def evaluate_bits(self, state, color):
+        '''Returns the value of a bitboard state for color'''
+        own   = state.bits[color]
+        opp   = state.bits[BLACK if color is WHITE else WHITE]
+        total = 0
+        for table, squares in self.masks:
+            index = 0
+            for bit, p in squares:
+                if own & bit:
+                    index += p
+                elif opp & bit:
+                    index += p + p
+            total += table[index]
+
+        return total
+
+
+if __name__ == '__main__':
+    out = sys.argv[1] if len(sys.argv) > 1 else 'weights.bin'
+    save_weights(out, default_weights())
+    print('Wrote default pattern weights to {}'.format(out))
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+# title           :perft.py
+# description     :Counts the move tree of Reversi to check move generation
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python perft.py [depth] [list|bitboard] [size]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BOARD_SIZE
+from reversiboard import ReversiBoard
+from bitboard import BitBoard
+import sys
+from time import time
+
+BOARDS = {'list': ReversiBoard, 'bitboard': BitBoard}
+
+# Number of leaves at every depth from the 8x8 start position. A pass counts
+# as a move, and a finished game counts as one leaf.
+KNOWN = {1: 4, 2: 12, 3: 56, 4: 244, 5: 1396, 6: 8200, 7: 55092,
+         8: 390216, 9: 3005288, 10: 24571284}
+
+
+def perft(board, depth, passed=False):
+    '''Returns the number of leaves of the move tree of board to depth.
+       Moves are made and taken back in place.
+    '''
+
+    moves = board.valid_moves()
+    if depth == 1 and moves != []:
+        return len(moves)
+
+    if moves == []:
+        if passed:
+            return 1
+        board.switch_turns()
+        count = 1 if depth == 1 else perft(board, depth - 1, True)
+        board.switch_turns()
+        return count
+
+    count = 0
+    for move in moves:
+        undo = board.make_move(move)
+        count += perft(board, depth - 1)
+        board.undo_move(undo)
+    return count
+
+
+def run(board_class, depth, size=BOARD_SIZE):
+    '''Runs perft on the start position for every depth up to depth, and
+       returns a list of (depth, leaves, seconds, ok) tuples. ok is None if
+       the count is not known.
+    '''
+
+    results = []
+    for d in range(1, depth + 1):
+        board = board_class(size)
+        start = time()
+        count = perft(board, d)
+        spent = time() - start
+        ok    = KNOWN.get(d) == count if size == 8 else None
+        results.append((d, count, spent, ok))
+    return results
+
+
+if __name__ == '__main__':
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    name  = sys.argv[2] if len(sys.argv) > 2 else 'bitboard'
+    size  = int(sys.argv[3]) if len(sys.argv) > 3 else BOARD_SIZE
+
+    failed = False
+    for d, count, spent, ok in run(BOARDS[name], depth, size):
+        status = {True: 'ok', False: 'WRONG', None: '?'}[ok]
+        print('perft({:2d}) = {:10d}  {:8.3f}s  {:9.0f} leaves/s  {}'.format(
+            d, count, spent, count / spent if spent else 0, status))
+        failed = failed or ok is False
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,335 @@
+#! /usr/bin/env python
+# title           :record.py
+# description     :A compact binary format for recorded Reversi games
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python record.py games.rvg | --import games.txt games.rvg
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, BOARD_SIZE, RECORD_FILE, RECORD_BLOCK
+from reversiboard import ReversiBoard, tile_name
+import argparse
+import os
+import re
+import struct
+import sys
+
+# Record file layout: a header of (magic, version), then blocks of records.
+# A block starts with (record count, length in bytes) and is written whole,
+# so files are only ever appended to. The index file next to the records
+# holds one (offset, record count) entry per block. It can be rebuilt from
+# the block headers, which is done when it is missing or out of date.
+#
+# A record is a header of (board size, black name length, white name length,
+# result, search depth, time per move in ms, move count), the player names
+# in UTF-8, then one byte per move: the square index (column - 1) * size +
+# (row - 1). Passes are not stored, as a player passes exactly when it has
+# no move.
+MAGIC   = b'RVGR'
+VERSION = 1
+HEADER  = struct.Struct('<4sB')
+BLOCK   = struct.Struct('<II')
+INDEX   = struct.Struct('<QI')
+RECORD  = struct.Struct('<BBBhHIH')
+
+TRANSCRIPT = re.compile(r'([a-z])(\d+)')
+
+
+class GameRecord(object):
+    '''
+        A recorded game: the names of the players, the engine settings, the
+        result as black discs minus white discs, and the moves as tiles.
+    '''
+
+    __slots__ = ('black', 'white', 'size', 'depth', 'time', 'result',
+                 'moves')
+
+    def __init__(self, moves, black='', white='', size=BOARD_SIZE, depth=0,
+                 time=0.0, result=None):
+        self.moves  = moves
+        self.black  = black
+        self.white  = white
+        self.size   = size
+        self.depth  = depth
+        self.time   = time
+        self.result = result
+
+    def transcript(self):
+        '''Returns the moves as a transcript such as f5d6c3'''
+        return to_transcript(self.moves)
+
+    def final_board(self, board_class=ReversiBoard):
+        '''Returns the board at the end of the game'''
+        board = None
+        for board, move in replay(self, board_class):
+            pass
+        if board is None:
+            board = board_class(self.size)
+        return board
+
+
+def to_transcript(moves):
+    '''Returns a list of tiles as a transcript such as f5d6c3'''
+    return ''.join(tile_name(move) for move in moves)
+
+
+def from_transcript(text):
+    '''Returns the list of tiles in a transcript such as f5d6c3. Spaces and
+       case are ignored. Raises ValueError if text is not a transcript.
+    '''
+
+    text = ''.join(text.split()).lower()
+    moves = [(ord(col) - ord('a') + 1, int(row))
+             for col, row in TRANSCRIPT.findall(text)]
+    if to_transcript(moves) != text:
+        raise ValueError('Not a transcript: {}'.format(text))
+    return moves
+
+
+def replay(record, board_class=ReversiBoard):
+    '''Plays the moves of a record on a new board, yielding (board, move)
+       after every move. The same board is yielded every time, so copy it to
+       keep a position. Raises ValueError at an illegal move.
+    '''
+
+    board = board_class(record.size)
+    for move in record.moves:
+        if board.valid_moves() == []:
+            board.switch_turns()
+        if not board.do_move(move):
+            raise ValueError('Illegal move {} in {}'.format(
+                tile_name(move), record.transcript()))
+        yield board, move
+
+
+def game_result(board):
+    '''Returns the result of a finished board as black minus white discs'''
+    return board.score[BLACK] - board.score[WHITE]
+
+
+def encode_record(record):
+    '''Returns a record as bytes'''
+
+    size   = record.size
+    black  = record.black.encode('utf-8')[:255]
+    white  = record.white.encode('utf-8')[:255]
+    result = record.result
+    if result is None:
+        result = game_result(record.final_board())
+    head = RECORD.pack(size, len(black), len(white), result, record.depth,
+                       int(round(record.time * 1000)), len(record.moves))
+    moves = bytes((col - 1) * size + row - 1 for col, row in record.moves)
+    return head + black + white + moves
+
+
+def decode_record(data, offset=0):
+    '''Reads the record at offset in data. Returns (record, offset of the
+       next record).
+    '''
+
+    size, nb, nw, result, depth, ms, count = RECORD.unpack_from(data, offset)
+    offset += RECORD.size
+    black   = bytes(data[offset:offset + nb]).decode('utf-8')
+    offset += nb
+    white   = bytes(data[offset:offset + nw]).decode('utf-8')
+    offset += nw
+    moves   = [(i // size + 1, i % size + 1)
+               for i in data[offset:offset + count]]
+    record  = GameRecord(moves, black, white, size, depth, ms / 1000, result)
+    return record, offset + count
+
+
+class RecordWriter(object):
+    '''
+        Appends game records to a record file. Records are kept in memory
+        until a block of block_size records is full, and then written in one
+        go along with its index entry. Call close, or use the writer in a
+        with statement, to write the last block.
+
+        The index of an existing file is written again from its blocks, and
+        a block cut short at the end, as left by a crash, is dropped.
+    '''
+
+    def __init__(self, path=RECORD_FILE, block_size=RECORD_BLOCK):
+        self.path       = path
+        self.block_size = block_size
+        self.pending    = []
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            blocks     = read_index(path)
+            self.file  = open(path, 'ab')
+            self.file.truncate(blocks_end(path, blocks))
+            self.file.seek(0, os.SEEK_END)
+            self.index = open(index_path(path), 'wb')
+            for block in blocks:
+                self.index.write(INDEX.pack(*block))
+            self.index.flush()
+        else:
+            self.file  = open(path, 'wb')
+            self.index = open(index_path(path), 'wb')
+            self.file.write(HEADER.pack(MAGIC, VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        '''Adds a record, writing a block if it is full'''
+        self.pending.append(encode_record(record))
+        if len(self.pending) >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes the records added so far as a block'''
+        if not self.pending:
+            return
+        data   = b''.join(self.pending)
+        offset = self.file.tell()
+        self.file.write(BLOCK.pack(len(self.pending), len(data)) + data)
+        self.file.flush()
+        self.index.write(INDEX.pack(offset, len(self.pending)))
+        self.index.flush()
+        self.pending = []
+
+    def close(self):
+        '''Writes the last block and closes the files'''
+        self.flush()
+        self.file.close()
+        self.index.close()
+
+
+def index_path(path):
+    '''Returns the path of the index file of a record file'''
+    return path + '.idx'
+
+
+def check_header(f, path):
+    '''Reads the file header of a record file, raising ValueError if it is
+       not one.
+    '''
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size or HEADER.unpack(data) != (MAGIC, VERSION):
+        raise ValueError('Not a game record file: {}'.format(path))
+
+
+def read_index(path):
+    '''Returns the blocks of a record file as a list of (offset, count).
+       The index file is used if it covers the whole record file, otherwise
+       the block headers are read from the record file, see scan_blocks.
+    '''
+
+    if os.path.exists(index_path(path)):
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+        blocks = list(INDEX.iter_unpack(data[:len(data) // INDEX.size *
+                                             INDEX.size]))
+        if blocks_end(path, blocks) == os.path.getsize(path):
+            return blocks
+    return scan_blocks(path)
+
+
+def scan_blocks(path):
+    '''Returns the blocks of a record file as a list of (offset, count),
+       read from the block headers. A block cut short at the end of the
+       file is left out.
+    '''
+
+    size   = os.path.getsize(path)
+    blocks = []
+    with open(path, 'rb') as f:
+        check_header(f, path)
+        while True:
+            offset = f.tell()
+            head   = f.read(BLOCK.size)
+            if len(head) < BLOCK.size:
+                break
+            count, length = BLOCK.unpack(head)
+            if offset + BLOCK.size + length > size:
+                break
+            blocks.append((offset, count))
+            f.seek(length, os.SEEK_CUR)
+    return blocks
+
+
+def blocks_end(path, blocks):
+    '''Returns the offset just past the last of blocks in a record file, or
+       None if its block header cannot be read.
+    '''
+
+    if not blocks:
+        return HEADER.size
+    offset = blocks[-1][0]
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        head = f.read(BLOCK.size)
+    if len(head) < BLOCK.size:
+        return None
+    count, length = BLOCK.unpack(head)
+    return offset + BLOCK.size + length
+
+
+def read_records(path=RECORD_FILE, start=0):
+    '''Yields the records of a record file one at a time, from record number
+       start. Only one block is held in memory at a time, and the blocks
+       before start are skipped using the index.
+    '''
+
+    blocks = read_index(path)
+    with open(path, 'rb') as f:
+        check_header(f, path)
+        first = 0
+        for offset, count in blocks:
+            if first + count <= start:
+                first += count
+                continue
+            f.seek(offset)
+            count, length = BLOCK.unpack(f.read(BLOCK.size))
+            data = memoryview(f.read(length))
+            pos  = 0
+            for i in range(count):
+                record, pos = decode_record(data, pos)
+                if first + i >= start:
+                    yield record
+            first += count
+
+
+def count_records(path=RECORD_FILE):
+    '''Returns the number of records in a record file'''
+    return sum(count for offset, count in read_index(path))
+
+
+def import_transcripts(lines, path=RECORD_FILE):
+    '''Appends a record for every transcript in lines to a record file. The
+       moves are checked by replaying them, which also gives the result.
+       Returns the number of records.
+    '''
+
+    count = 0
+    with RecordWriter(path) as writer:
+        for line in lines:
+            if not line.strip():
+                continue
+            writer.write(GameRecord(from_transcript(line)))
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Prints or imports recorded games')
+    parser.add_argument('path', nargs='?', default=RECORD_FILE)
+    parser.add_argument('--import', dest='source', metavar='FILE',
+                        help='append the transcripts in FILE, - for stdin')
+    parser.add_argument('--start', type=int, default=0,
+                        help='first record to print')
+    args = parser.parse_args()
+
+    if args.source:
+        lines = sys.stdin if args.source == '-' else open(args.source)
+        print('Imported {} games into {}'.format(
+            import_transcripts(lines, args.path), args.path))
+    else:
+        for record in read_records(args.path, args.start):
+            print('{} {:+d}'.format(record.transcript(), record.result))
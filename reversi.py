@@ -7,19 +7,40 @@
 # =============================================================================
 
 import reversiboard as rb
-from constants import BLACK, WHITE, EMPTY, BOARD_SIZE
+import transposition as tt
+import ordering
+import endgame
+import book
+from stats import SearchStats
+from constants import BLACK, WHITE, BOARD_SIZE
 from constants import CUTOFF_DEPTH, CUTOFF_TIME, CUTOFF_MARGIN
+from constants import ASPIRATION_WINDOW, NODE_LIMIT
 import random
-from copy import deepcopy
+import threading
 from time import time
 
+# Width of the zero window used to test moves in principal variation search.
+# The evaluation is not integer valued, so a small fraction is used.
+NULL_WINDOW = 1e-6
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the time for the current move is up'''
+    pass
+
 
 class Node(object):
     '''
-        Basic node object to build the search tree used in the Reversi class
+        Basic node object to build the search tree used in the Reversi class.
+
+        Only the root and its children are kept. The children hold the move
+        and its value, but no board, so the tree stays small however long the
+        search runs.
     '''
 
-    def __init__(self, data, parent=None, action=(-1, -1)):
+    __slots__ = ('state', 'children', 'parent', 'value', 'action')
+
+    def __init__(self, data=None, parent=None, action=(-1, -1)):
         self.state    = data
         self.children = []
         self.parent   = parent
@@ -36,16 +57,27 @@ class Reversi(object):
     '''
         A game of reversi that uses minimax search with alpha-beta pruning
 
-        Initializes a 8x8 board with typical starting pieces. The computer
+        Initializes a size x size board with typical starting pieces. The computer
         plays as WHITE while the player is BLACK.
         The player should make his moves with try_move((column, row)).
         Tips can be turned on with toggle_hints
+
+        The board representation can be chosen with board_class, e.g.
+        bitboard.BitBoard for the faster bitboard backend. evaluator replaces
+        the built in eval heuristic, e.g. with patterns.PatternEvaluator, and
+        must be for the same board size. The opening book only covers 8x8 boards.
     '''
 
-    def __init__(self):
-        self.board          = rb.ReversiBoard(BOARD_SIZE)
+    def __init__(self, board_class=rb.ReversiBoard, evaluator=None,
+                 size=BOARD_SIZE):
+        if getattr(evaluator, 'size', size) != size:
+            raise ValueError('The evaluator is for {0}x{0} boards, not '
+                             '{1}x{1}'.format(evaluator.size, size))
+
+        self.board          = board_class(size)
+        self.evaluator      = evaluator
         self.score          = {BLACK: 2, WHITE: 2}
-        self.size           = BOARD_SIZE
+        self.size           = size
         self.root           = None
         self.game_over      = False
 
@@ -55,6 +87,74 @@ class Reversi(object):
         self.cutoff_depth   = CUTOFF_DEPTH
         self.cutoff_time    = CUTOFF_TIME
 
+        # Kept between searches, so later moves reuse earlier results
+        self.tt             = tt.TranspositionTable()
+
+        # Only take values from the transposition table that were searched to
+        # exactly the depth needed, instead of at least that deep. Results
+        # then depend only on the position and depth, not on what was
+        # searched before, as parallel.ParallelSearch needs.
+        self.tt_exact       = False
+
+        # Move ordering, can be set to None to search moves in board order
+        self.orderer        = ordering.MoveOrderer(size)
+
+        # Principal variation search and aspiration windows. With both turned
+        # off the search is a plain alpha-beta search.
+        self.pvs            = True
+        self.aspiration     = ASPIRATION_WINDOW
+        self.nodes          = 0
+
+        # Most nodes to search per move, None for no limit. Like the time
+        # limit, it does not apply to the first iteration.
+        self.node_limit     = NODE_LIMIT
+        self.node_cap       = float('inf')
+
+        # Longest time in seconds any search may take, None for no limit.
+        # Unlike cutoff_time it also bounds fixed depth searches, but like
+        # it, it does not apply to the first iteration.
+        self.search_limit   = None
+
+        # Exact endgame solver, used instead of the search once few enough
+        # squares are empty. Can be set to None to always search.
+        self.solver         = endgame.EndgameSolver(size)
+
+        # Opening book, consulted by update before searching. None if there
+        # is no book file.
+        self.book           = book.open_book()
+
+        # Search statistics, collected only if collect_stats is set. stats
+        # holds those of the last search.
+        self.collect_stats  = False
+        self.stats          = None
+
+        # Set by parallel.ParallelSearch to spread the root over processes
+        self.parallel       = None
+
+        # Iterative deepening state
+        self.search_depth   = CUTOFF_DEPTH
+        self.depth_reached  = 0
+        self.deadline       = None
+        self.root_order     = []
+
+        # True if the last search solved the position exactly, so that the
+        # root value is the final disc differential, not a heuristic value
+        self.solved         = False
+
+        # Background search, see start_search
+        self.background     = False
+        self.searcher       = None
+        self.search_key     = None
+        self.cancelled      = False
+
+        # Pondering, searching the predicted reply on the player's time
+        self.ponder         = False
+        self.pondering      = False
+        self.ponder_move    = None
+        self.ponder_start   = 0
+        self.ponder_stats   = {'ponders': 0, 'hits': 0, 'misses': 0,
+                               'saved': 0.0}
+
         self.timer          = time()
         self.alpha_timer    = time()
         self.black_time     = 0
@@ -66,43 +166,333 @@ class Reversi(object):
         '''Tries to make a move at (tile[0], tile[1]) with the current board'''
 
         color = self.board.turn
+        hit = self.pondering and tile == self.ponder_move
         success = self.board.do_move(tile)
         if success:
+            if hit:
+                self.ponder_hit()
+            else:
+                if self.pondering:
+                    self.ponder_stats['misses'] += 1
+                self.cancel_search()
             self.score = self.board.score
             self.update_timer(color)
 
         return success
 
+    def clear_memory(self):
+        '''Forgets what earlier searches learned, the transposition table and
+           the move ordering statistics, so the next search depends only on
+           its own position.
+        '''
+
+        self.tt.clear()
+        if self.orderer is not None:
+            self.orderer = ordering.MoveOrderer(self.size)
+
     def toggle_hints(self):
         '''Toggles the use of the alpha-beta-search when it's the player's turn.
            If True, the optimal move can then be fetched with get_optimal_move.
         '''
         self.hints = not self.hints
 
-    def alpha_beta_search(self):
+    def alpha_beta_search(self, board=None):
         '''Runs a minimax search with alpha-beta pruning. The optimal move is
            then retrievable with get_optimal_move
+
+           The search is iteratively deepened, one ply at a time up to
+           cutoff_depth, or until the time is up if time_cut is set. The result
+           of the last completed iteration is kept, and its move values are
+           used to order the root moves of the next iteration. The first
+           iteration always completes, so a move is always available.
+
+           Each iteration after the first starts with an aspiration window
+           around the previous value, and widens it if the value falls
+           outside.
+
+           The optimal move is updated after every completed iteration, so it
+           can be read while the search runs in the background. board is the
+           position to search, the current one by default.
+
+           Once no more squares are empty than the solver allows, the position
+           is solved exactly instead, see solve_endgame. If the solve runs out
+           of time the position is searched as usual, and the first iteration
+           gives the move.
+
+           Returns the SearchStats of the search if collect_stats is set, and
+           None otherwise.
         '''
 
+        board            = (board or self.board).copy()
         self.alpha_timer = time()
-        self.root = Node(self.board)
-        self.root.value = self.max_value(self.root, -float('inf'), float('inf'), 0)
+        self.tt.new_search()
+        if self.orderer is not None:
+            self.orderer.new_search()
+        self.root_order  = []
+        self.deadline    = None
+        self.node_cap    = float('inf')
+        self.nodes       = 0
+        self.solved      = False
+
+        stats = SearchStats() if self.collect_stats else None
+        if stats is not None:
+            stats.instrument(self)
+        try:
+            if (self.solver is not None and
+                    board.empties <= self.solver.empties):
+                try:
+                    self.solve_endgame(board)
+                except SearchTimeout:
+                    self.deadline = None
+                    if not self.cancelled:
+                        self.iterative_deepening(board, stats)
+            else:
+                self.iterative_deepening(board, stats)
+        finally:
+            if stats is not None:
+                stats.release(self)
+                stats.finish(self)
+                self.stats = stats
+
+        return stats
+
+    def iterative_deepening(self, board, stats=None):
+        '''Searches board one ply deeper at a time, as described in
+           alpha_beta_search. Completed iterations are added to stats, if
+           given. With a time limit, an iteration that is not expected to
+           finish before the deadline is not started, see
+           next_iteration_time.
+        '''
+
+        if self.time_cut:
+            max_depth = board.empties + 1
+        else:
+            max_depth = self.cutoff_depth
+
+        inf    = float('inf')
+        values = {}
+        times  = {}
+        for depth in range(2, max(max_depth, 2) + 1):
+            self.search_depth = depth
+            started = time()
+            alpha, beta = -inf, inf
+            if self.aspiration and depth - 2 in values:
+                alpha = values[depth - 2] - self.aspiration
+                beta  = values[depth - 2] + self.aspiration
+
+            try:
+                while True:
+                    root = Node(board)
+                    root.value = self.search_root(root, alpha, beta)
+                    if root.value <= alpha:
+                        alpha = -inf
+                    elif root.value >= beta:
+                        beta = inf
+                    else:
+                        break
+            except SearchTimeout:
+                break
+
+            self.root          = root
+            self.depth_reached = depth
+            values[depth]      = root.value
+            self.root_order    = [c.action for c in
+                                  sorted(root.children, key=self.child_order)]
+            self.calc_optimal_move()
+            times[depth]       = time() - started
+            if stats is not None:
+                stats.add_iteration(depth, self.nodes)
+            if self.time_cut and not self.pondering or \
+                    self.search_limit is not None:
+                self.deadline = self.search_deadline()
+                if time() + self.next_iteration_time(times, depth) > \
+                        self.deadline:
+                    break
+            if self.node_limit is not None:
+                self.node_cap = self.node_limit
+
+        self.deadline = None
+        self.node_cap = float('inf')
+
+    def search_deadline(self):
+        '''Returns the time the current search has to stop by, from
+           cutoff_time if time_cut is set and search_limit if it is not None.
+           Returns None if neither applies.
+        '''
+
+        deadline = None
+        if self.time_cut and not self.pondering:
+            deadline = self.alpha_timer + self.cutoff_time - CUTOFF_MARGIN
+        if self.search_limit is not None:
+            limit    = self.alpha_timer + self.search_limit
+            deadline = limit if deadline is None else min(deadline, limit)
+        return deadline
+
+    def next_iteration_time(self, times, depth):
+        '''Estimates the time of the iteration after depth from the times of
+           the iterations so far, assuming each one takes as many times longer
+           than the one before as the last did. The growth follows the
+           branching factor, so it is larger on larger boards.
+        '''
+
+        if times.get(depth - 1):
+            return times[depth] * max(times[depth] / times[depth - 1], 1.0)
+        return times[depth]
+
+    def start_search(self, board=None, ponder=False):
+        '''Starts alpha_beta_search in a background thread and returns at once.
+           Searches board, or the current position by default. Any search
+           already running is cancelled. Use poll_search or await_search to
+           get the result.
+
+           A ponder search has no time limit until ponder_hit is called.
+           The position is copied before the thread starts, so moves made
+           right after this call do not change what is searched.
+        '''
+
+        board = (board or self.board).copy()
+        self.cancel_search()
+        self.root       = None
+        self.pondering  = ponder
+        self.search_key = board.encode()
+        self.searcher   = threading.Thread(target=self.alpha_beta_search,
+                                           args=(board,))
+        self.searcher.daemon = True
+        self.searcher.start()
+
+    def searching(self):
+        '''Returns True while a background search is running'''
+        return self.searcher is not None and self.searcher.is_alive()
+
+    def poll_search(self):
+        '''Returns a tuple of (done, move) for the background search. move is
+           the best move of the deepest completed iteration so far, or None.
+        '''
+        return not self.searching(), self.get_optimal_move()
+
+    def await_search(self, timeout=None):
+        '''Waits for the background search to finish, for at most timeout
+           seconds if given. Returns (done, move) like poll_search.
+        '''
+
+        if self.searcher is not None:
+            self.searcher.join(timeout)
+        return self.poll_search()
+
+    def cancel_search(self):
+        '''Stops the background search, if one is running. The best move of
+           the last completed iteration is kept.
+        '''
+
+        if self.searching():
+            self.cancelled = True
+            if self.parallel is not None:
+                self.parallel.cancel()
+            self.searcher.join()
+            self.cancelled = False
+        self.searcher   = None
+        self.search_key = None
+        self.pondering  = False
+
+    def predict_reply(self):
+        '''Returns the expected move of the player to move, or None if there
+           is none. This is the next move of the principal variation, as kept
+           in the transposition table, or else the first move in move order.
+        '''
+
+        actions = self.actions(self.board)
+        entry   = self.tt.probe(self.board.hash)
+        if entry is not None and entry[3] in actions:
+            return entry[3]
+        if actions == []:
+            return None
+        return self.ordered_actions(self.board, 1)[0]
+
+    def start_ponder(self):
+        '''Starts searching the position after the player's predicted reply
+           in the background, while the player is thinking. Pondering is
+           skipped while hints are on, as the search is then used for the
+           player's hints.
+        '''
+
+        if self.hints or self.game_over:
+            return
+        move = self.predict_reply()
+        if move is None:
+            return
+
+        board = self.board.copy()
+        board.do_move(move)
+        if self.book_move(board) is not None:
+            return
+        self.start_search(board, ponder=True)
+        self.ponder_move  = move
+        self.ponder_start = time()
+        self.ponder_stats['ponders'] += 1
+
+    def ponder_hit(self):
+        '''Called when the player made the predicted reply. The ponder search
+           goes on as the computer's search, with the usual time limit counted
+           from now. Any iteration that was finished while pondering is kept.
+        '''
+
+        now = time()
+        self.ponder_stats['hits']  += 1
+        self.ponder_stats['saved'] += now - self.ponder_start
+        self.alpha_timer = now
+        self.pondering   = False
+
+        # Without a completed iteration the search sets the deadline itself
+        # once the first iteration is done
+        if self.root is not None and self.time_cut:
+            self.deadline = now + self.cutoff_time - CUTOFF_MARGIN
+
+    def ponder_report(self):
+        '''Returns a one line summary of how well pondering worked'''
+        stats = self.ponder_stats
+        guessed = stats['hits'] + stats['misses']
+        rate = stats['hits'] / guessed if guessed else 0.0
+        return ('Ponder hits: {}/{} ({:.0%}), time saved: {:.1f}s'
+                .format(stats['hits'], guessed, rate, stats['saved']))
+
+    def solve_endgame(self, board):
+        '''Solves board to the end of the game with the endgame solver. The
+           root value is then the final disc differential for the player to
+           move, and the best move is its only child with a value. Raises
+           SearchTimeout if the time runs out or the search is cancelled
+           first, see solver_stop.
+        '''
+
+        self.solver.nodes = 0
+        root = Node(board)
+        try:
+            root.value, move = self.solver.solve(board, stop=self.solver_stop)
+        finally:
+            self.deadline = None
+        if move is not None:
+            root.add_child(None, move).value = root.value
+
+        self.nodes         = self.solver.nodes
+        self.root          = root
+        self.depth_reached = board.empties
+        self.root_order    = [c.action for c in root.children]
+        self.solved        = True
         self.calc_optimal_move()
 
-        if not self.check_search_success():
-            self.repeat_search()
+    def solver_stop(self):
+        '''Stop test of the endgame solver, see check_stop. The deadline is
+           read again every time, so a ponder search that becomes the real
+           search after ponder_hit gets its time limit.
+        '''
 
-    def repeat_search(self):
-        print('Alpha-beta search did not return a valid result.\n'
-              'It\'s possible the search value is too small: {}s'
-              .format(self.cutoff_time))
-        self.cutoff_time += 0.5
-        print('Search time increased to {}s'.format(self.cutoff_time))
-        self.alpha_beta_search()
+        self.deadline = self.search_deadline()
+        self.check_stop()
 
-    def check_search_success(self):
-        '''Returns True if the search tree node has a valid action'''
-        return self.board.valid_move(self.root.action)
+    def child_order(self, child):
+        '''Sort key for the root children, best value first. Children that
+           only have a bound for a value go last.
+        '''
+        return -child.value if child.value is not None else float('inf')
 
     def calc_optimal_move(self):
         '''Selects an optimal move after an alpha-beta search. If there are
@@ -122,7 +512,9 @@ class Reversi(object):
             return None
 
     def optimal_moves(self):
-        '''Returns a list of all optimal moves'''
+        '''Returns a list of all optimal moves. Moves that were only proven to
+           be no better than the best one have no value, and are left out.
+        '''
 
         if self.root is None:
             return []
@@ -137,6 +529,16 @@ class Reversi(object):
         '''Updates the game.
            Runs the required search when it's the computer's turn. Also runs the
            search for the player if hints are turned on.
+
+           If background is set, the search runs in a background thread and
+           update returns at once. The computer's move is made by the first
+           call to update after the search has finished.
+
+           If ponder is set, the computer starts searching the player's
+           predicted reply right after making its move.
+
+           The computer plays from the opening book without searching while
+           the position is in the book.
         '''
 
         if self.game_over:
@@ -158,15 +560,49 @@ class Reversi(object):
         if self.board.turn == BLACK:
             # Do we need to do the alpha-beta search?
             if not self.has_calculated:
-                if self.hints:
+                if self.hints and self.background:
+                    self.start_search()
+                elif self.hints:
                     self.alpha_beta_search()
                 self.has_calculated = True
             return
 
         # It's the computer's turn
         self.has_calculated = False
-        self.alpha_beta_search()
+        move = self.book_move()
+        if move is not None:
+            self.try_move(move)
+            if self.ponder:
+                self.start_ponder()
+            return
+
+        if self.search_key == self.board.encode():
+            # Already searching this position, e.g. after a ponder hit
+            if self.background and self.searching():
+                return
+            self.await_search()
+        elif self.background:
+            self.start_search()
+            return
+        else:
+            self.alpha_beta_search()
+
         self.try_move(self.root.action)
+        if self.ponder:
+            self.start_ponder()
+
+    def book_move(self, board=None):
+        '''Returns the book move for board, the current position by default,
+           or None if there is no book or the position is not in it.
+        '''
+
+        if self.book is None:
+            return None
+        board = board or self.board
+        found = self.book.probe(board)
+        if found is None or found[0] not in board.valid_moves():
+            return None
+        return found[0]
 
     def update_timer(self, color):
         '''Updates the turn time for the appropriate player'''
@@ -187,7 +623,7 @@ class Reversi(object):
            action/move
         '''
 
-        new_state = deepcopy(state)
+        new_state = state.copy()
         new_state.do_move(action)
         return new_state
 
@@ -195,8 +631,35 @@ class Reversi(object):
         '''Returns all valid actions for the specified state'''
         return state.valid_moves()
 
-    def eval(self, state):
-        '''Heuristic that tries to determine the utility of the state.
+    def ordered_actions(self, state, depth, best=None):
+        '''Returns the valid actions for state, sorted by the move orderer.
+           best is the move to try first, e.g. from the transposition table.
+        '''
+        actions = self.actions(state)
+        if self.orderer is not None:
+            self.orderer.order(actions, depth, state.turn, best)
+        return actions
+
+    def root_actions(self, state):
+        '''Returns the valid actions at the root, best first according to the
+           previous iteration of the search.
+        '''
+        entry   = self.tt.probe(state.hash)
+        actions = self.ordered_actions(state, 1, entry and entry[3])
+        rank    = dict((a, i) for i, a in enumerate(self.root_order))
+        actions.sort(key=lambda a: rank.get(a, 0))
+        return actions
+
+    def record_cutoff(self, state, action, depth, index):
+        '''Lets the move orderer know that action caused a cutoff'''
+        if self.orderer is not None:
+            self.orderer.record_cutoff(action, depth, state.turn,
+                                       self.search_depth - depth, index)
+
+    def eval(self, state, color=None):
+        '''Heuristic that tries to determine the utility of the state for
+           color, by default the player the search is run for. Uses the
+           evaluator instead, if one is set.
 
            Uses three statistics to compute a value:
                1. Score for the active player in state
@@ -204,26 +667,27 @@ class Reversi(object):
                3. The mobility, i.e. number of moves available to both players
         '''
 
+        if color is None:
+            color = self.board.turn
+        if self.evaluator is not None:
+            return self.evaluator.evaluate(state, color)
+
+        other   = state.opposite(color)
         weights = {'score': 500, 'corners': 100, 'mobility': 300}
 
         # 1. Current score
-        max_score = state.score[self.board.turn]
-        min_score = state.score[state.opposite(self.board.turn)]
+        max_score = state.score[color]
+        min_score = state.score[other]
         p = self._eval(max_score, min_score, weights['score'])
 
-        # Number of occupied corners
-        corners = {BLACK: 0, WHITE: 0, EMPTY: 0}
-        corner_list = [(1, 1), (1, 8), (8, 1), (8, 8)]
-        for corner in corner_list:
-            corners[state.get_tile(corner)] += 1
-
-        max_corn = corners[self.board.turn]
-        min_corn = corners[state.opposite(self.board.turn)]
+        # Number of occupied corners, kept up to date by the board
+        max_corn = state.corners[color]
+        min_corn = state.corners[other]
         c = self._eval(max_corn, min_corn, weights['corners'])
 
         # Mobility of players
-        max_mob = len(state.valid_moves(color=self.board.turn))
-        min_mob = len(state.valid_moves(color=state.opposite(self.board.turn)))
+        max_mob = state.mobility(color)
+        min_mob = state.mobility(other)
         m = self._eval(max_mob, min_mob, weights['mobility'])
 
         return p + c + m
@@ -237,66 +701,153 @@ class Reversi(object):
 
         return p
 
-    def max_value(self, node, alpha, beta, depth):
-        '''Performs a minimax search with alpha-beta pruning. Returns the action
-           corresponding to the max of the min_value.
-           Search ends when reaching a terminal state or when reaching the
-           cutoff limit.
+    def search_root(self, root, alpha, beta):
+        '''Searches the root node within the (alpha, beta) window. Adds a child
+           for every move searched, with its value if it is exact. Returns the
+           value of the root for the player to move.
         '''
 
-        depth += 1
-        if self.cut_off_test(node.state, depth, node.state.turn):
-            return self.eval(node.state)
-
-        v = -float('inf')
-        for action in self.actions(node.state):
-            child = node.add_child(self.result(node.state, action), action)
-            v = max(v, self.min_value(child, alpha, beta, depth))
-            child.value = v
+        if self.parallel is not None:
+            return self.parallel.search_root(self, root, alpha, beta)
+
+        state = root.state
+        self.nodes += 1
+        if self.terminal_test(state, state.turn):
+            return self.eval(state, state.turn)
+
+        a, v, best = alpha, -float('inf'), None
+        for i, action in enumerate(self.root_actions(state)):
+            undo  = state.make_move(action)
+            score = self.search_move(state, alpha, beta, 1, i == 0)
+            state.undo_move(undo)
+
+            child = root.add_child(None, action)
+            child.value = score if alpha < score < beta else None
+            if score > v:
+                v, best = score, action
             if v >= beta:
-                return v
+                break
             alpha = max(alpha, v)
 
+        self.tt_save(state, 1, a, beta, v, best)
         return v
 
-    def min_value(self, node, alpha, beta, depth):
-        '''Performs a minimax search with alpha-beta pruning. Returns the action
-           corresponding to the min of the max_value.
+    def search_move(self, state, alpha, beta, depth, first):
+        '''Returns the value of the move just made on state, from the point of
+           view of the player who made it.
+
+           With principal variation search, only the first move is searched
+           with the full window. The other moves are first tested with a zero
+           window, which only proves whether they are better than alpha, and
+           are searched again with the full window if they are.
+        '''
+
+        if first or not self.pvs:
+            return -self.negamax(state, -beta, -alpha, depth)
+
+        score = -self.negamax(state, -alpha - NULL_WINDOW, -alpha, depth)
+        if alpha < score < beta:
+            score = -self.negamax(state, -beta, -alpha, depth)
+        return score
+
+    def negamax(self, state, alpha, beta, depth):
+        '''Performs a minimax search with alpha-beta pruning, in negamax form.
+           Returns the value of state for the player to move.
            Search ends when reaching a terminal state or when reaching the
-           cutoff limit.
+           cutoff limit. Moves are made on state in place and taken back
+           before returning.
         '''
 
+        self.nodes += 1
         depth += 1
-        if self.cut_off_test(node.state, depth, node.state.turn):
-            return self.eval(node.state)
-
-        v = -float('inf')
-        for action in self.actions(node.state):
-            child = node.add_child(self.result(node.state, action), action)
-            v = max(v, self.max_value(child, alpha, beta, depth))
-            child.value = v
-            if v <= alpha:
-                return v
-            beta = min(beta, v)
+        if self.cut_off_test(state, depth, state.turn):
+            return self.eval(state, state.turn)
+
+        a = alpha
+        hit, move = self.tt_lookup(state, depth, alpha, beta)
+        if hit is not None:
+            return hit
+
+        v, best = -float('inf'), None
+        for i, action in enumerate(self.ordered_actions(state, depth, move)):
+            undo  = state.make_move(action)
+            score = self.search_move(state, alpha, beta, depth, i == 0)
+            state.undo_move(undo)
+            if score > v:
+                v, best = score, action
+            if v >= beta:
+                self.record_cutoff(state, action, depth, i)
+                break
+            alpha = max(alpha, v)
 
+        self.tt_save(state, depth, a, beta, v, best)
         return v
 
-    def cut_off_test(self, state, depth, color):
-        '''Returns True if the cutoff depth/time has been reached, or if the
-           game has reached a terminal state.
+    def tt_lookup(self, state, depth, alpha, beta):
+        '''Looks the state up in the transposition table. Returns a tuple of
+           (value, move). The value is the stored value if it is deep enough to
+           settle the node within the (alpha, beta) window, None otherwise.
+           The move is the best move stored for the state, if any.
         '''
 
-        if not self.time_cut:
-            return depth >= self.cutoff_depth or self.terminal_test(state,
-                                                                    color)
-        elif (time() - self.alpha_timer) >= (self.cutoff_time - CUTOFF_MARGIN):
-            return True
+        entry = self.tt.probe(state.hash)
+        if entry is None:
+            return None, None
+        needed = self.search_depth - depth
+        if entry[0] < needed or self.tt_exact and entry[0] != needed:
+            return None, entry[3]
+
+        bound, value = entry[1], entry[2]
+        if bound == tt.EXACT:
+            return value, entry[3]
+        if bound == tt.LOWER and value >= beta:
+            return value, entry[3]
+        if bound == tt.UPPER and value <= alpha:
+            return value, entry[3]
+        return None, entry[3]
+
+    def tt_save(self, state, depth, alpha, beta, value, move):
+        '''Stores the result of searching state with the (alpha, beta) window
+           in the transposition table. Values are always from the point of view
+           of the player to move.
+        '''
+
+        if value <= alpha:
+            bound = tt.UPPER
+        elif value >= beta:
+            bound = tt.LOWER
         else:
-            return self.terminal_test(state, color)
+            bound = tt.EXACT
+
+        self.tt.store(state.hash, self.search_depth - depth, bound, value, move)
+
+    def cut_off_test(self, state, depth, color):
+        '''Returns True if the depth of the current iteration has been reached,
+           or if the game has reached a terminal state. Raises SearchTimeout
+           like check_stop, which is not called here to keep the search fast.
+        '''
+
+        if self.cancelled or self.nodes >= self.node_cap:
+            raise SearchTimeout()
+        if self.deadline is not None and time() >= self.deadline:
+            raise SearchTimeout()
+
+        return depth >= self.search_depth or self.terminal_test(state, color)
+
+    def check_stop(self):
+        '''Raises SearchTimeout once the deadline of a time limited search has
+           passed, the node limit has been reached, or the search has been
+           cancelled.
+        '''
+
+        if self.cancelled or self.nodes >= self.node_cap:
+            raise SearchTimeout()
+        if self.deadline is not None and time() >= self.deadline:
+            raise SearchTimeout()
 
     def terminal_test(self, state, color):
         '''Checks if a terminal state has been reached (no moves)'''
-        return state.board_full() or state.valid_moves(color) == []
+        return state.board_full() or state.mobility(color) == 0
 
 
 if __name__ == '__main__':
@@ -7,6 +7,18 @@
 # =============================================================================
 
 from constants import BLACK, WHITE, EMPTY
+from bisect import insort
+from string import ascii_lowercase
+import random
+
+# Move directions in tuple form
+DIRECTIONS = [(-1, 0), ( 0, -1), ( 1, 0), ( 0,  1),
+              ( 1, 1), (-1, -1), (-1, 1), ( 1, -1)]
+
+# Fixed seed, so that every process agrees on the position hashes
+ZOBRIST_SEED = 20170205
+_zobrist     = {}
+_rays        = {}
 
 
 def add(t1, t2):
@@ -14,48 +26,226 @@ def add(t1, t2):
     return (t1[0] + t2[0], t1[1] + t2[1])
 
 
+def tile_name(tile):
+    '''Returns the name of a tile in the usual notation, e.g. d3 for (4, 3)'''
+    return ascii_lowercase[tile[0] - 1] + str(tile[1])
+
+
+def parse_tile(text):
+    '''Returns the (column, row) tuple of a tile name such as d3, or None if
+       text is not a tile name.
+    '''
+
+    text = text.strip().lower()
+    if len(text) < 2 or text[0] not in ascii_lowercase or \
+            not text[1:].isdigit():
+        return None
+    return (ascii_lowercase.index(text[0]) + 1, int(text[1:]))
+
+
+def zobrist_keys(size):
+    '''Returns the Zobrist keys for a board of the given size, as a tuple of
+       ({color: [one 64 bit key per square]}, key for WHITE to move).
+       Squares are indexed column by column, (column - 1) * size + row - 1.
+    '''
+
+    if size not in _zobrist:
+        rand    = random.Random(ZOBRIST_SEED + size)
+        squares = size * size
+        keys    = {BLACK: [rand.getrandbits(64) for _ in range(squares)],
+                   WHITE: [rand.getrandbits(64) for _ in range(squares)]}
+        _zobrist[size] = (keys, rand.getrandbits(64))
+
+    return _zobrist[size]
+
+
+def ray_table(size):
+    '''Returns the rays of every square on a board of the given size. A ray is
+       a (direction, square indexes) tuple listing the squares from the
+       square out to the edge of the board. Rays that are too short to ever
+       flip a piece (less than two squares) are left out.
+       The table is only built once per board size.
+    '''
+
+    if size not in _rays:
+        table = []
+        for col in range(size):
+            for row in range(size):
+                rays = []
+                for d in DIRECTIONS:
+                    ray = []
+                    i, j = col + d[0], row + d[1]
+                    while 0 <= i < size and 0 <= j < size:
+                        ray.append(i * size + j)
+                        i, j = i + d[0], j + d[1]
+                    if len(ray) >= 2:
+                        rays.append((d, tuple(ray)))
+                table.append(rays)
+        _rays[size] = table
+
+    return _rays[size]
+
+
 class ReversiBoard(object):
-    '''Creates a board of reversi and keeps track of pieces and legal moves'''
+    '''Creates a board of reversi and keeps track of pieces and legal moves
+
+       The pieces are stored in a flat list, self.cells, indexed column by
+       column. Flips are found by walking the precomputed rays of a square.
+    '''
 
     def __init__(self, size):
-        self.board = self.create_board(size, size)
         self.size  = size
+        self.cells = [EMPTY] * (size * size)
         self.score = {BLACK: 0, WHITE: 0}
         self.turn  = None
         self.last  = None
+        self.dirs  = DIRECTIONS
+        self.hash  = 0
+        self.rays  = ray_table(size)
+        self.tiles = [(i + 1, j + 1) for i in range(size) for j in range(size)]
+
+        self.keys, self.turn_key = zobrist_keys(size)
 
-        # Move directions in tuple form
-        self.dirs  = [(-1, 0), ( 0, -1), ( 1, 0), ( 0,  1),
-                      ( 1, 1), (-1, -1), (-1, 1), ( 1, -1)]
+        # Legal moves are cached per position version, see cached_moves. The
+        # hit and miss counters are shared with every copy of the board.
+        self.version    = 0
+        self.move_cache = {BLACK: None, WHITE: None}
+        self.move_stats = {'hits': 0, 'misses': 0}
+
+        # Kept up to date by set_tile, so they never need a full board scan
+        self.empties       = size * size
+        self.empty_squares = self.tiles[:]
+        self.corners       = {BLACK: 0, WHITE: 0}
+        self.corner_tiles  = set([(1, 1), (1, size), (size, 1), (size, size)])
 
         self.init_pieces()
 
+    def copy(self):
+        '''Returns an independent snapshot of the board. Much cheaper than a
+           deepcopy, as only the mutable parts are copied.
+        '''
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        other.cells         = self.cells[:]
+        other.score         = dict(self.score)
+        other.empty_squares = self.empty_squares[:]
+        other.corners       = dict(self.corners)
+        other.move_cache    = dict(self.move_cache)
+        return other
+
+    @property
+    def board(self):
+        '''A 2d array view of the board, indexed [column - 1][row - 1]'''
+        size = self.size
+        return [self.cells[i * size:(i + 1) * size] for i in range(size)]
+
     def init_pieces(self):
-        '''Initializes the board with the classic setup of 2x2 pieces'''
-        self.set_tiles([(4, 4), (5, 5)], WHITE)
-        self.set_tiles([(4, 5), (5, 4)], BLACK)
+        '''Initializes the board with the classic setup of 2x2 pieces in the
+           centre
+        '''
+        mid = self.size // 2
+        self.set_tiles([(mid, mid), (mid + 1, mid + 1)], WHITE)
+        self.set_tiles([(mid, mid + 1), (mid + 1, mid)], BLACK)
 
-        self.score = {BLACK: 2, WHITE: 2}
         self.turn  = BLACK
-        self.last  = (4, 4)
+        self.last  = (mid, mid)
 
     def create_board(self, cols, rows):
         '''Creates a 2d array with EMPTY slots'''
         return [[EMPTY for x in range(rows)] for x in range(cols)]
 
+    def index(self, tile):
+        '''Returns the index of the tile in self.cells'''
+        return (tile[0] - 1) * self.size + tile[1] - 1
+
     def set_tiles(self, tiles, color):
         '''Takes a list of tiles (tuples) and sets them to "color"'''
         for t in tiles:
             self.set_tile(t, color)
 
     def set_tile(self, tile, color):
-        '''Sets a single tile (tuple) to "color"'''
-        if self.is_on_board(tile):
-            self.board[tile[0] - 1][tile[1] - 1] = color
+        '''Sets a single tile (tuple) to "color". Updates the hash, the score,
+           the empty squares and the corner counts to match.
+        '''
+
+        if not self.is_on_board(tile):
+            return
+        index = self.index(tile)
+        old   = self.cells[index]
+        if old is color:
+            return
+
+        tile   = self.tiles[index]
+        corner = tile in self.corner_tiles
+        if old is EMPTY:
+            self.empties -= 1
+            self.empty_squares.remove(tile)
+        else:
+            self.hash ^= self.keys[old][index]
+            self.score[old] -= 1
+            if corner:
+                self.corners[old] -= 1
+
+        if color is EMPTY:
+            self.empties += 1
+            insort(self.empty_squares, tile)
+        else:
+            self.hash ^= self.keys[color][index]
+            self.score[color] += 1
+            if corner:
+                self.corners[color] += 1
+
+        self.cells[index] = color
+        self.version += 1
 
     def switch_turns(self):
         '''Switches the active player'''
         self.turn = BLACK if self.turn is WHITE else WHITE
+        self.hash ^= self.turn_key
+        self.version += 1
+
+    def compute_hash(self):
+        '''Computes the Zobrist hash of the position from scratch. The hash is
+           otherwise kept up to date incrementally in self.hash.
+        '''
+
+        h = self.turn_key if self.turn is WHITE else 0
+        for i in range(self.size):
+            for j in range(self.size):
+                value = self.get_tile((i + 1, j + 1))
+                if value is not EMPTY:
+                    h ^= self.keys[value][i * self.size + j]
+
+        return h
+
+    def encode(self):
+        '''Returns the position as a compact (black, white, turn) tuple, where
+           bit i of black and white is square i of self.cells. Meant for
+           sending positions between processes.
+        '''
+
+        black, white = 0, 0
+        for i, value in enumerate(self.cells):
+            if value is BLACK:
+                black |= 1 << i
+            elif value is WHITE:
+                white |= 1 << i
+
+        return black, white, self.turn
+
+    def set_position(self, black, white, turn):
+        '''Sets up the position from a tuple returned by encode'''
+        for i, tile in enumerate(self.tiles):
+            if black >> i & 1:
+                self.set_tile(tile, BLACK)
+            elif white >> i & 1:
+                self.set_tile(tile, WHITE)
+            else:
+                self.set_tile(tile, EMPTY)
+
+        if self.turn is not turn:
+            self.switch_turns()
+        self.last = None
 
     def is_on_board(self, tile):
         '''Returns True if the tile is a valid (column, row) tuple'''
@@ -81,62 +271,102 @@ class ReversiBoard(object):
            flipped.
         '''
 
-        if self.is_occupied(tile):
+        index = self.index(tile)
+        cells = self.cells
+        if cells[index] is not EMPTY:
             return False
 
-        for d in self.dirs:
-            if self.flips_in_dir(tile, d, color) != []:
-                return True
+        other = BLACK if color is WHITE else WHITE
+        for d, ray in self.rays[index]:
+            if cells[ray[0]] is not other:
+                continue
+            for i in ray:
+                value = cells[i]
+                if value is not other:
+                    if value is color:
+                        return True
+                    break
 
         return False
 
+    def flip_indexes(self, index, color):
+        '''Returns the indexes of the pieces that setting the square at index
+           to color would flip.
+        '''
+
+        cells = self.cells
+        other = BLACK if color is WHITE else WHITE
+        flips = []
+        for d, ray in self.rays[index]:
+            if cells[ray[0]] is not other:
+                continue
+            for k, i in enumerate(ray):
+                value = cells[i]
+                if value is not other:
+                    if value is color:
+                        flips.extend(ray[:k])
+                    break
+
+        return flips
+
     def flips_in_dir(self, tile, direction, color):
         '''Iterates from tile in direction, and determines if setting the tile
            to color will cause a piece to be flipped in that directiona.
            Returns a list of the flippable tiles.
         '''
 
-        flips = []
-        step  = add(tile, direction)
-        found_ally, found_foe = False, False
-
-        while self.is_on_board(step) and self.get_tile(step) is not EMPTY:
-            value = self.get_tile(step)
-            if value is color:
-                found_ally = True
-            elif value is self.opposite(color) and not found_ally:
-                flips.append(step)
-                found_foe = True
-
-            step = add(step, direction)
+        cells = self.cells
+        other = self.opposite(color)
+        for d, ray in self.rays[self.index(tile)]:
+            if d != direction:
+                continue
+            for k, i in enumerate(ray):
+                value = cells[i]
+                if value is not other:
+                    if value is color:
+                        return [self.tiles[j] for j in ray[:k]]
+                    break
 
-        if found_ally and found_foe:
-            return flips
-        else:
-            return []
+        return []
 
     def flips(self, tile, color):
         '''Checks all directions for flippable tiles, assuming tile is set to
            color. Returns a list of the flippable tiles.
         '''
 
-        flips = []
-        for d in self.dirs:
-            flips += (self.flips_in_dir(tile, d, color))
+        tiles = self.tiles
+        return [tiles[i] for i in self.flip_indexes(self.index(tile), color)]
 
-        return flips
+    def find_moves(self, color):
+        '''Returns a list of legal moves for color, without the cache'''
+        return [t for t in self.empty_squares if self.can_flip(t, color)]
+
+    def cached_moves(self, color):
+        '''Returns the legal moves for color as found by find_moves. They are
+           cached until the position changes, which every change to the
+           board signals by counting up self.version.
+        '''
+
+        entry = self.move_cache[color]
+        if entry is not None and entry[0] == self.version:
+            self.move_stats['hits'] += 1
+            return entry[1]
+        self.move_stats['misses'] += 1
+        moves = self.find_moves(color)
+        self.move_cache[color] = (self.version, moves)
+        return moves
 
     def valid_moves(self, color=None):
         '''Returns a list of legal moves for color'''
         if color is None:
             color = self.turn
-        moves = []
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.valid_move((i + 1, j + 1), color):
-                    moves.append((i + 1, j + 1))
+        return self.cached_moves(color)[:]
 
-        return moves
+    def mobility(self, color=None):
+        '''Returns the number of legal moves for color'''
+        if color is None:
+            color = self.turn
+        return len(self.cached_moves(color))
 
     def opposite(self, color):
         '''Returns the opposite color. Assumes the only colors sent in are BLACK
@@ -152,22 +382,66 @@ class ReversiBoard(object):
 
     def get_tile(self, tile):
         '''Returns the value at the specified tile'''
-        return self.board[tile[0] - 1][tile[1] - 1]
+        return self.cells[(tile[0] - 1) * self.size + tile[1] - 1]
 
     def do_move(self, tile):
         '''Makes a move at the selected tile, with the active player, if the
            move is valid. Then calculates score and switches turns.
         '''
+        return self.make_move(tile) is not None
 
-        if self.valid_move(tile):
-            self.set_tile(tile, self.turn)
-            self.do_flips(tile)
-            self.switch_turns()
-            self.last = tile
-            self.calc_score()
-            return True
+    def make_move(self, tile):
+        '''Makes a move in place, like do_move, and returns an undo record that
+           can be passed to undo_move. Returns None if the move is not valid.
 
-        return False
+           The record is a tuple of (tile, flipped square indexes, previous
+           turn, previous last move, previous score).
+        '''
+
+        if not self.is_on_board(tile):
+            return None
+        index = self.index(tile)
+        if self.cells[index] is not EMPTY:
+            return None
+        flips = self.flip_indexes(index, self.turn)
+        if flips == []:
+            return None
+
+        color, other = self.turn, self.opposite(self.turn)
+        undo = (tile, flips, color, self.last,
+                (self.score[BLACK], self.score[WHITE]))
+
+        self.set_tile(tile, color)
+        self.flip_cells(flips, color, other)
+        self.switch_turns()
+        self.last = tile
+        return undo
+
+    def undo_move(self, undo):
+        '''Takes back a move made with make_move, using its undo record'''
+        tile, flips, turn, last, score = undo
+        self.flip_cells(flips, self.opposite(turn), turn)
+        self.set_tile(tile, EMPTY)
+        if self.turn is not turn:
+            self.hash ^= self.turn_key
+        self.turn  = turn
+        self.last  = last
+        self.score[BLACK], self.score[WHITE] = score
+
+    def flip_cells(self, flips, color, other):
+        '''Flips the pieces at the indexes in flips from other to color'''
+        cells = self.cells
+        keys  = self.keys[color]
+        okeys = self.keys[other]
+        h     = self.hash
+        for i in flips:
+            cells[i] = color
+            h ^= keys[i] ^ okeys[i]
+
+        self.hash          = h
+        self.version      += 1
+        self.score[color] += len(flips)
+        self.score[other] -= len(flips)
 
     def do_flips(self, tile, color=None):
         '''Carries out the flips required for the specified move.'''
@@ -177,33 +451,33 @@ class ReversiBoard(object):
 
     def board_full(self):
         '''Returns True if the board is full.'''
-        return sum(x.count(EMPTY) for x in self.board) == 0
+        return self.empties == 0
 
     def calc_score(self):
-        '''Calculates the score and stores in self.score'''
-        self.score[BLACK] = sum(x.count(BLACK) for x in self.board)
-        self.score[WHITE] = sum(x.count(WHITE) for x in self.board)
+        '''Calculates the score and stores in self.score. The score is kept up
+           to date by set_tile, so this is only needed as a consistency check.
+        '''
+        self.score[BLACK] = self.cells.count(BLACK)
+        self.score[WHITE] = self.cells.count(WHITE)
 
     def ascii(self):
         '''Prints out an ASCII version of the current board.'''
 
-        cols, rows = len(self.board), len(self.board[0])
-        margin = '  ' if rows < 10 else '   '
+        board = self.board
+        cols, rows = len(board), len(board[0])
+        margin = ' ' * (len(str(rows)) + 2)
 
         # Print top
-        letters = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
-        top = margin + ' '
+        top = margin
         for i in range(cols):
-            space = ' ' if i < 9 else ''
-            top += ' ' + letters[i] + '.' + space
+            top += ' ' + ascii_lowercase[i] + '. '
         print(top)
-        print(margin + ' ' + cols * '+---' + '+')
+        print(margin + cols * '+---' + '+')
 
         # Print rows
         for j in range(rows):
-            space = ' ' if j < 9 else ''
-            out = str(j+1) + '.' + space
+            out = (str(j + 1) + '.').ljust(len(margin))
             for i in range(cols):
-                out += '| ' + str(self.board[i][j]) + ' '
+                out += '| ' + str(board[i][j]) + ' '
             print(out + '|')
-            print(margin + space + cols * '+---' + '+')
+            print(margin + cols * '+---' + '+')
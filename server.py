@@ -0,0 +1,346 @@
+#! /usr/bin/env python
+# title           :server.py
+# description     :Hosts many Reversi games over a JSON lines protocol
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python server.py [--port N | --unix path] [--workers N]
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, BOARD_SIZE
+from constants import SERVER_HOST, SERVER_PORT, SERVER_BUDGET, SERVER_LIMIT
+from constants import SERVER_QUEUE, SERVER_DEPTH
+from reversi import Reversi
+from reversiboard import tile_name, parse_tile
+from bitboard import BitBoard
+from endgame import to_string
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+import traceback
+from time import time
+
+# Protocol: every request is one line of JSON with a "cmd", and gets one line
+# of JSON back. A request "id" is copied to the reply.
+#   {"cmd": "new"}                              starts a game
+#   {"cmd": "move", "session": 1, "move": "d3"} plays a move for a player
+#   {"cmd": "think", "session": 1, "time": 0.5} lets the engine play a move,
+#                                               "depth" instead of "time"
+#                                               searches to a fixed depth.
+#                                               Every search stops after
+#                                               SERVER_LIMIT seconds.
+#   {"cmd": "state", "session": 1}              returns the position
+#   {"cmd": "close", "session": 1}              ends the game
+#   {"cmd": "stats"}                            returns server statistics
+# Errors are replied as {"error": message}. An engine request that finds the
+# queue full gets {"error": "busy"} and can be sent again later.
+
+LATENCY_WINDOW = 10000          # Engine requests kept for the percentiles
+
+# The engine of a worker process, set up by init_worker
+_engine = None
+
+
+def init_worker():
+    '''Creates the engine of a worker process, with no search taking more
+       than SERVER_LIMIT seconds. Ctrl-C is left to the server process.
+    '''
+    global _engine
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _engine = Reversi(BitBoard)
+    _engine.search_limit = SERVER_LIMIT
+
+
+def engine_move(code, budget, depth):
+    '''Finds the engine's move for an encoded position, in a worker process.
+       Searches for budget seconds, or to depth if it is given. Returns a
+       tuple of (move, depth reached, nodes, seconds).
+    '''
+
+    start  = time()
+    engine = _engine
+    engine.board.set_position(*code)
+    move = engine.book_move()
+    if move is not None:
+        return move, 0, 0, time() - start
+
+    if depth:
+        engine.time_cut     = False
+        engine.cutoff_depth = depth
+    else:
+        engine.time_cut     = True
+        engine.cutoff_time  = budget
+    engine.alpha_beta_search()
+    return (engine.get_optimal_move(), engine.depth_reached, engine.nodes,
+            time() - start)
+
+
+def search_budget(request):
+    '''Returns the (time, depth) budget asked for by a think request, capped
+       at SERVER_LIMIT seconds and SERVER_DEPTH plies. Raises ValueError if
+       the time is not a positive number or the depth is negative.
+    '''
+
+    budget = float(request.get('time', SERVER_BUDGET))
+    if not (math.isfinite(budget) and budget > 0):
+        raise ValueError('Invalid time: {}'.format(request.get('time')))
+    depth = int(request.get('depth', 0))
+    if depth < 0:
+        raise ValueError('Invalid depth: {}'.format(depth))
+    return min(budget, SERVER_LIMIT), min(depth, SERVER_DEPTH)
+
+
+def percentiles(values, points=(50, 90, 99)):
+    '''Returns {point: value} for the given percentiles of values'''
+    ordered = sorted(values)
+    if not ordered:
+        return dict((p, 0.0) for p in points)
+    return dict((p, ordered[min(len(ordered) - 1, len(ordered) * p // 100)])
+                for p in points)
+
+
+class Session(object):
+    '''A game hosted by the server, stored as its encoded position'''
+
+    __slots__ = ('code', 'moves', 'busy')
+
+    def __init__(self, code):
+        self.code  = code
+        self.moves = []
+        self.busy  = False
+
+
+class GameServer(object):
+    '''
+        Hosts game sessions for any number of clients.
+
+        Sessions are kept in memory as encoded positions, so thousands of
+        games take little space. Engine moves are searched in a process pool
+        with one search per worker at a time. Requests beyond that wait in a
+        queue, and once queue_limit requests are waiting new ones are turned
+        away as busy. Clients are served one request at a time per
+        connection, so a client that waits for its reply is slowed down too.
+    '''
+
+    def __init__(self, workers=None, queue_limit=SERVER_QUEUE):
+        self.workers     = workers or os.cpu_count() or 1
+        self.pool        = ProcessPoolExecutor(self.workers,
+                                               initializer=init_worker)
+        self.slots       = None
+        self.queue_limit = queue_limit
+        self.sessions    = {}
+        self.next_id     = 1
+        self.waiting     = 0
+        self.running     = 0
+        self.served      = 0
+        self.rejected    = 0
+        self.latencies   = deque(maxlen=LATENCY_WINDOW)
+
+    def close(self):
+        '''Shuts the worker processes down'''
+        self.pool.shutdown()
+
+    async def handle(self, reader, writer):
+        '''Serves one client connection until it closes'''
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = {}
+            try:
+                request = json.loads(line.decode())
+                if not isinstance(request, dict):
+                    raise ValueError('Request must be a JSON object')
+                reply = await self.dispatch(request)
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'error': str(e)}
+            except Exception:
+                traceback.print_exc()
+                reply = {'error': 'internal error'}
+            if 'id' in request:
+                reply['id'] = request['id']
+            writer.write((json.dumps(reply) + '\n').encode())
+            await writer.drain()
+        writer.close()
+
+    async def dispatch(self, request):
+        '''Runs a request and returns the reply'''
+
+        cmd = request.get('cmd')
+        if cmd == 'new':
+            return self.new_game()
+        if cmd == 'stats':
+            return self.stats()
+        if cmd not in ('move', 'think', 'state', 'close'):
+            raise ValueError('Unknown command: {}'.format(cmd))
+
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ValueError('No such session: {}'.format(
+                request.get('session')))
+
+        if cmd == 'state':
+            return self.state(session)
+        if cmd == 'close':
+            del self.sessions[request['session']]
+            return {'closed': request['session']}
+        if session.busy:
+            raise ValueError('The engine is thinking in this session')
+        if cmd == 'move':
+            tile = parse_tile(str(request.get('move', '')))
+            return self.play(session, tile)
+
+        budget, depth = search_budget(request)
+        return await self.think(session, budget, depth)
+
+    def new_game(self):
+        '''Starts a session from the start position'''
+        sid = self.next_id
+        self.next_id += 1
+        self.sessions[sid] = Session(BitBoard(BOARD_SIZE).encode())
+        reply = self.state(self.sessions[sid])
+        reply['session'] = sid
+        return reply
+
+    def state(self, session):
+        '''Returns the position of a session as a reply'''
+        board = self.board(session)
+        moves = board.valid_moves()
+        return {'board': to_string(board),
+                'turn': 'black' if board.turn is BLACK else 'white',
+                'score': [board.score[BLACK], board.score[WHITE]],
+                'moves': [tile_name(m) for m in moves],
+                'game_over': moves == [],
+                'history': ''.join(session.moves)}
+
+    def board(self, session):
+        '''Returns a board set up with the position of a session'''
+        board = BitBoard(BOARD_SIZE)
+        board.set_position(*session.code)
+        return board
+
+    def play(self, session, tile):
+        '''Plays tile for the player to move, then passes for the next player
+           if it has no move. Returns the new state.
+        '''
+
+        board = self.board(session)
+        if tile is None or not board.do_move(tile):
+            raise ValueError('Invalid move')
+        if board.valid_moves() == []:
+            board.switch_turns()
+            if board.valid_moves() == []:
+                board.switch_turns()
+        session.code = board.encode()
+        session.moves.append(tile_name(tile))
+        return self.state(session)
+
+    async def think(self, session, budget, depth):
+        '''Searches the session's position in the pool and plays the move'''
+
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.workers)
+        if self.waiting >= self.queue_limit:
+            self.rejected += 1
+            return {'error': 'busy', 'queue': self.waiting}
+        if self.board(session).valid_moves() == []:
+            raise ValueError('The game is over')
+
+        start = time()
+        loop  = asyncio.get_event_loop()
+        session.busy = True
+        try:
+            self.waiting += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+
+            self.running += 1
+            try:
+                move, reached, nodes, spent = await loop.run_in_executor(
+                    self.pool, engine_move, session.code, budget, depth)
+            finally:
+                self.running -= 1
+                self.slots.release()
+        finally:
+            session.busy = False
+
+        latency = time() - start
+        self.latencies.append(latency)
+        self.served += 1
+
+        reply = self.play(session, move)
+        reply.update({'move': tile_name(move), 'depth': reached,
+                      'nodes': nodes, 'search': spent, 'latency': latency})
+        return reply
+
+    def stats(self):
+        '''Returns the queue depth, load and engine latency percentiles'''
+        p = percentiles(self.latencies)
+        return {'sessions': len(self.sessions), 'workers': self.workers,
+                'running': self.running, 'queue': self.waiting,
+                'served': self.served, 'rejected': self.rejected,
+                'latency': {'p50': p[50], 'p90': p[90], 'p99': p[99]}}
+
+    def report(self):
+        '''Returns the statistics as one line of text'''
+        s = self.stats()
+        return ('sessions {sessions} running {running}/{workers} queue '
+                '{queue} served {served} rejected {rejected} '.format(**s) +
+                'latency p50 {p50:.3f}s p90 {p90:.3f}s p99 {p99:.3f}s'.format(
+                    **s['latency']))
+
+
+async def report_every(server, seconds):
+    '''Prints the server statistics to stderr every few seconds'''
+    while True:
+        await asyncio.sleep(seconds)
+        print(server.report(), file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hosts Reversi games')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--unix', help='serve on a Unix socket instead')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--queue', type=int, default=SERVER_QUEUE)
+    parser.add_argument('--report', type=float, default=10.0,
+                        help='seconds between statistics lines, 0 for none')
+    args = parser.parse_args()
+
+    loop   = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = GameServer(args.workers, args.queue)
+    if args.unix:
+        start = asyncio.start_unix_server(server.handle, args.unix)
+        where = args.unix
+    else:
+        start = asyncio.start_server(server.handle, args.host, args.port)
+        where = '{}:{}'.format(args.host, args.port)
+    listener = loop.run_until_complete(start)
+    if args.report:
+        loop.create_task(report_every(server, args.report))
+    print('Serving on {} with {} workers'.format(where, server.workers),
+          file=sys.stderr, flush=True)
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        server.close()
+        print(server.report(), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
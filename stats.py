@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+# title           :stats.py
+# description     :Statistics collected during a Reversi search
+# author          :andresthor
+# date            :05-02-2017
+# python_version  :3.5.2
+# =============================================================================
+
+from time import time
+
+
+class SearchStats(object):
+    '''
+        Statistics of a single alpha-beta search: nodes, leaves, depths,
+        cutoffs, transposition table and move cache use and the nodes and
+        time of every iteration.
+
+        The counters are gathered by wrapping the search methods of the engine
+        with instrument, and unwrapped again with release. An engine that does
+        not collect statistics runs its search methods unchanged, so the
+        statistics cost nothing when they are turned off.
+    '''
+
+    WRAPPED = ('cut_off_test', 'tt_lookup', 'record_cutoff')
+
+    def __init__(self):
+        self.start         = time()
+        self.seconds       = 0.0
+        self.nodes         = 0
+        self.leaves        = 0
+        self.depth_sum     = 0
+        self.max_depth     = 0
+        self.depth_reached = 0
+        self.cutoffs       = 0
+        self.first_cutoffs = 0
+        self.tt_probes     = 0
+        self.tt_hits       = 0
+        self.move_hits     = 0
+        self.move_misses   = 0
+        self.iterations    = []
+
+    def instrument(self, engine):
+        '''Wraps the search methods of engine so they update these stats'''
+
+        moves = engine.board.move_stats
+        self.move_hits   = -moves['hits']
+        self.move_misses = -moves['misses']
+
+        cut_off_test  = engine.cut_off_test
+        tt_lookup     = engine.tt_lookup
+        record_cutoff = engine.record_cutoff
+
+        def counted_cut_off_test(state, depth, color):
+            if cut_off_test(state, depth, color):
+                self.leaves    += 1
+                self.depth_sum += depth
+                if depth > self.max_depth:
+                    self.max_depth = depth
+                return True
+            return False
+
+        def counted_tt_lookup(state, depth, alpha, beta):
+            found = tt_lookup(state, depth, alpha, beta)
+            self.tt_probes += 1
+            if found[0] is not None:
+                self.tt_hits += 1
+            return found
+
+        def counted_record_cutoff(state, action, depth, index):
+            self.cutoffs += 1
+            if index == 0:
+                self.first_cutoffs += 1
+            record_cutoff(state, action, depth, index)
+
+        engine.cut_off_test  = counted_cut_off_test
+        engine.tt_lookup     = counted_tt_lookup
+        engine.record_cutoff = counted_record_cutoff
+
+    def release(self, engine):
+        '''Removes the wrappers added by instrument'''
+        for name in self.WRAPPED:
+            engine.__dict__.pop(name, None)
+
+    def add_iteration(self, depth, nodes):
+        '''Records a completed iteration, with the total nodes so far'''
+        self.iterations.append((depth, nodes, time() - self.start))
+
+    def finish(self, engine):
+        '''Takes the final totals from engine after the search'''
+        self.seconds       = time() - self.start
+        self.nodes         = engine.nodes
+        self.depth_reached = engine.depth_reached
+        self.move_hits    += engine.board.move_stats['hits']
+        self.move_misses  += engine.board.move_stats['misses']
+
+    def interior(self):
+        '''Returns the number of nodes that were expanded'''
+        return max(self.nodes - self.leaves - self.tt_hits, 0)
+
+    def cutoff_rate(self):
+        '''Returns the share of expanded nodes that had a beta cutoff'''
+        interior = self.interior()
+        return self.cutoffs / interior if interior else 0.0
+
+    def first_cutoff_rate(self):
+        '''Returns how often the first move tried caused the cutoff'''
+        return self.first_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def tt_hit_rate(self):
+        '''Returns the share of table probes that settled the node'''
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def move_hit_rate(self):
+        '''Returns the share of legal move lookups answered by the cache'''
+        lookups = self.move_hits + self.move_misses
+        return self.move_hits / lookups if lookups else 0.0
+
+    def average_depth(self):
+        '''Returns the average depth of the evaluated leaves'''
+        return self.depth_sum / self.leaves if self.leaves else 0.0
+
+    def nps(self):
+        '''Returns the nodes searched per second'''
+        return self.nodes / self.seconds if self.seconds else 0.0
+
+    def branching_factor(self):
+        '''Returns the effective branching factor, the average growth in nodes
+           from one iteration to the next.
+        '''
+
+        steps = [(d, n - m) for (d, n, _), (_, m, _) in
+                 zip(self.iterations, [(0, 0, 0)] + self.iterations)]
+        steps = [(d, n) for d, n in steps if n > 0]
+        if len(steps) < 2:
+            return 0.0
+        (d0, n0), (d1, n1) = steps[0], steps[-1]
+        return (n1 / n0) ** (1.0 / (d1 - d0))
+
+    def time_per_depth(self):
+        '''Returns a list of (depth, seconds) for every iteration'''
+        return [(d, t) for d, n, t in self.iterations]
+
+    def as_dict(self):
+        '''Returns the statistics as a plain dict'''
+        return {'nodes': self.nodes, 'leaves': self.leaves,
+                'seconds': self.seconds, 'nps': self.nps(),
+                'depth': self.depth_reached, 'max_depth': self.max_depth,
+                'average_depth': self.average_depth(),
+                'cutoff_rate': self.cutoff_rate(),
+                'first_cutoff_rate': self.first_cutoff_rate(),
+                'tt_hits': self.tt_hits, 'tt_hit_rate': self.tt_hit_rate(),
+                'move_hits': self.move_hits,
+                'move_hit_rate': self.move_hit_rate(),
+                'branching_factor': self.branching_factor(),
+                'time_per_depth': self.time_per_depth()}
+
+    def lines(self):
+        '''Returns the statistics as short lines of text'''
+        return ['Depth {} (max {}, avg {:.1f})'.format(
+                    self.depth_reached, self.max_depth, self.average_depth()),
+                'Nodes {} ({} leaves)'.format(self.nodes, self.leaves),
+                'Time {:.2f}s, {:.0f} nodes/s'.format(self.seconds,
+                                                      self.nps()),
+                'Cutoffs {:.0%}, first move {:.0%}'.format(
+                    self.cutoff_rate(), self.first_cutoff_rate()),
+                'TT hits {} ({:.0%})'.format(self.tt_hits,
+                                             self.tt_hit_rate()),
+                'Move cache hits {} ({:.0%})'.format(self.move_hits,
+                                                     self.move_hit_rate()),
+                'Branching factor {:.2f}'.format(self.branching_factor())]
+
+    def report(self):
+        '''Returns the statistics as a multi line string, with the time taken
+           by every iteration.
+        '''
+        times = ', '.join('{}: {:.3f}s'.format(d, t)
+                          for d, t in self.time_per_depth())
+        return '\n'.join(self.lines() + ['Time per depth: ' + times])
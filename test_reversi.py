@@ -0,0 +1,431 @@
+#! /usr/bin/env python
+# title           :test_reversi.py
+# description     :Tests for the Reversi boards, engine and tools
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python -m pytest test_reversi.py
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, EMPTY, ENDGAME_EMPTIES
+from reversi import Reversi
+from reversiboard import ReversiBoard
+from bitboard import BitBoard
+from endgame import EndgameSolver, endgame_positions
+import book
+import json
+import os
+import patterns
+import perft
+import pytest
+import random
+from time import sleep, time
+
+BOARDS = [ReversiBoard, BitBoard]
+
+
+def random_game(rng, size=8):
+    '''Returns the moves of a game of random moves'''
+    board = BitBoard(size)
+    moves = []
+    while True:
+        if board.valid_moves() == []:
+            board.switch_turns()
+            if board.valid_moves() == []:
+                return moves
+        moves.append(rng.choice(board.valid_moves()))
+        board.do_move(moves[-1])
+
+
+def random_positions(count, plies, size=8, seed=0):
+    '''Returns count BitBoards reached by plies random moves, each with a
+       move for the player to move.
+    '''
+
+    rng       = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = BitBoard(size)
+        for _ in range(plies):
+            moves = board.valid_moves()
+            if moves == []:
+                break
+            board.do_move(rng.choice(moves))
+        if board.valid_moves() != []:
+            positions.append(board)
+    return positions
+
+
+@pytest.mark.parametrize('board_class', BOARDS)
+def test_perft(board_class):
+    depth = 6 if board_class is ReversiBoard else 7
+    for d, count, spent, ok in perft.run(board_class, depth):
+        assert count == perft.KNOWN[d]
+
+
+@pytest.mark.parametrize('size', [6, 8, 10])
+def test_boards_agree(size):
+    rng = random.Random(size)
+    for game in range(10):
+        boards = [board_class(size) for board_class in BOARDS]
+        while True:
+            moves = [sorted(b.valid_moves()) for b in boards]
+            assert moves[0] == moves[1]
+            assert boards[0].encode() == boards[1].encode()
+            assert boards[0].hash == boards[1].hash
+            assert boards[0].score == boards[1].score
+            assert boards[0].empties == boards[1].empties
+            if moves[0] == []:
+                for b in boards:
+                    b.switch_turns()
+                if boards[0].valid_moves() == []:
+                    break
+                continue
+            move = rng.choice(moves[0])
+            for b in boards:
+                assert b.do_move(move)
+
+
+@pytest.mark.parametrize('board_class', BOARDS)
+def test_make_undo(board_class):
+    for start in random_positions(20, 20):
+        board = board_class(8)
+        board.set_position(*start.encode())
+        before = (board.encode(), board.hash, dict(board.score),
+                  board.empties, sorted(board.valid_moves()))
+        for move in board.valid_moves():
+            version = board.version
+            undo    = board.make_move(move)
+            assert board.version > version
+            assert board.hash == board.compute_hash()
+            version = board.version
+            board.undo_move(undo)
+            assert board.version > version
+            assert (board.encode(), board.hash, dict(board.score),
+                    board.empties, sorted(board.valid_moves())) == before
+        taken = [(c, r) for c in range(1, 9) for r in range(1, 9)
+                 if board.get_tile((c, r)) is not EMPTY]
+        assert board.make_move(taken[0]) is None
+        assert board.encode() == before[0]
+
+
+def search(board, depth, **options):
+    '''Searches board to depth with a fresh engine, without the book or the
+       endgame solver. Returns the engine.
+    '''
+
+    engine = Reversi(BitBoard)
+    engine.book         = None
+    engine.solver       = None
+    engine.time_cut     = False
+    engine.cutoff_depth = depth
+    for key, value in options.items():
+        setattr(engine, key, value)
+    engine.board.set_position(*board.encode())
+    engine.alpha_beta_search()
+    return engine
+
+
+def test_pvs_matches_alpha_beta():
+    for board in random_positions(12, 16, seed=2):
+        plain = search(board, 4, pvs=False, aspiration=None)
+        fast  = search(board, 4)
+        assert fast.root.value == pytest.approx(plain.root.value)
+        assert fast.get_optimal_move() in plain.optimal_moves()
+
+
+def test_pattern_weights_size(tmp_path):
+    path = str(tmp_path / 'weights.bin')
+    patterns.save_weights(path, patterns.default_weights(8), 8)
+    assert patterns.PatternEvaluator(8, path).weights == \
+        patterns.default_weights(8)
+    with pytest.raises(ValueError):
+        patterns.PatternEvaluator(10, path)
+
+
+def test_evaluator_size_must_match_board():
+    evaluator = patterns.PatternEvaluator(10)
+    assert Reversi(BitBoard, evaluator, 10).evaluator is evaluator
+    with pytest.raises(ValueError):
+        Reversi(BitBoard, evaluator, 8)
+
+
+def test_batch_board_matches():
+    pytest.importorskip('numpy')
+    from batchboard import BatchBoard
+    import bitboard as bb
+
+    boards = random_positions(50, 20, seed=4)
+    batch  = BatchBoard.from_boards(boards)
+    legal  = batch.legal_moves()
+    values = batch.evaluate()
+    engine = Reversi(BitBoard)
+    rng    = random.Random(4)
+    moves  = [rng.choice(b.valid_moves()) for b in boards]
+    played = batch.apply([bb.bit_index(m, 8) for m in moves]).to_boards()
+    for i, board in enumerate(boards):
+        assert int(legal[i]) == board.move_bits(board.turn)
+        assert values[i] == pytest.approx(engine.eval(board, board.turn))
+        board.do_move(moves[i])
+        assert played[i].encode() == board.encode()
+
+
+def parallel_engine(depth, workers=2):
+    '''Returns an engine searching to depth with a ParallelSearch attached,
+       and the ParallelSearch.
+    '''
+
+    from parallel import ParallelSearch
+
+    engine = Reversi(BitBoard)
+    engine.book         = None
+    engine.solver       = None
+    engine.time_cut     = False
+    engine.cutoff_depth = depth
+    return engine, ParallelSearch(engine, workers)
+
+
+def test_parallel_matches_serial():
+    engine, pool = parallel_engine(4)
+    try:
+        for board in random_positions(4, 14, seed=3):
+            serial = search(board, 4, tt_exact=True)
+            engine.tt = serial.tt.__class__()
+            engine.board.set_position(*board.encode())
+            engine.alpha_beta_search()
+            assert engine.root.value == pytest.approx(serial.root.value)
+            assert sorted(engine.optimal_moves()) == \
+                sorted(serial.optimal_moves())
+    finally:
+        pool.close()
+
+
+def test_parallel_search_cancels():
+    engine, pool = parallel_engine(20)
+    try:
+        engine.start_search()
+        sleep(1.0)
+        start = time()
+        engine.cancel_search()
+        assert time() - start < 1.0
+        assert engine.get_optimal_move() in engine.board.valid_moves()
+    finally:
+        pool.close()
+
+
+def test_background_search_snapshots_board():
+    for board in random_positions(5, 10, seed=7):
+        engine = Reversi(BitBoard)
+        engine.book         = None
+        engine.time_cut     = False
+        engine.cutoff_depth = 3
+        engine.board.set_position(*board.encode())
+
+        # Start slowly, so the move below is made before the search begins
+        search = engine.alpha_beta_search
+        engine.alpha_beta_search = lambda board=None: (sleep(0.02),
+                                                       search(board))
+        engine.start_search()
+        engine.board.do_move(engine.board.valid_moves()[0])
+        done, move = engine.await_search()
+        assert done
+        assert engine.root.state.encode() == board.encode()
+        assert move in board.valid_moves()
+
+
+def test_solver_stops_at_deadline():
+    board  = endgame_positions(14, 1, seed=5)[0]
+    engine = Reversi(BitBoard)
+    engine.book        = None
+    engine.solver      = EndgameSolver(8, 14)
+    engine.cutoff_time = 0.6
+    engine.board.set_position(*board.encode())
+    start = time()
+    engine.alpha_beta_search()
+    assert time() - start < engine.cutoff_time + 0.25
+    assert engine.get_optimal_move() in board.valid_moves()
+
+
+def test_book_found_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    first, second = book.open_book(), book.open_book()
+    if first is None:
+        pytest.skip('No opening book file')
+    assert first is second
+    assert Reversi(BitBoard).book is first
+
+
+def test_broken_book_is_skipped(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    open(path, 'wb').close()
+    with pytest.warns(UserWarning):
+        assert book.open_book(path) is None
+
+    with open(path, 'wb') as f:
+        f.write(book.HEADER.pack(book.MAGIC, book.VERSION, book.SIZE, 10))
+    with pytest.warns(UserWarning):
+        assert book.open_book(path) is None
+
+
+def test_replaced_book_is_closed(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    with open(path, 'wb') as f:
+        f.write(book.HEADER.pack(book.MAGIC, book.VERSION, book.SIZE, 0))
+    old = book.open_book(path)
+    assert book.open_book(path) is old
+
+    with open(path, 'wb') as f:
+        f.write(book.HEADER.pack(book.MAGIC, book.VERSION, book.SIZE, 1))
+        f.write(book.RECORD.pack(0, 0, 0, 0, 0))
+    os.utime(path, ns=(0, 0))
+    new = book.open_book(path)
+    assert new is not old and len(new) == 1
+    assert old.data.closed
+    assert old.probe(BitBoard(8)) is None
+
+
+def test_book_moves_add_no_nodes(monkeypatch):
+    import tournament
+
+    # Every other move comes from the book, and the rest are searched
+    searched = []
+    search   = Reversi.alpha_beta_search
+
+    def book_move(self, board=None):
+        if self.board.empties % 2 == 0:
+            return self.board.valid_moves()[0]
+        return None
+
+    def alpha_beta_search(self, board=None):
+        stats = search(self, board)
+        searched.append(self.nodes)
+        return stats
+
+    monkeypatch.setattr(Reversi, 'book_move', book_move)
+    monkeypatch.setattr(Reversi, 'alpha_beta_search', alpha_beta_search)
+    config  = tournament.parse_config('cutoff_depth=2')
+    opening = tournament.random_openings(1, 2)[0]
+    result  = tournament.play_game(config, config, opening, BLACK)
+    assert result['a']['nodes'] + result['b']['nodes'] == sum(searched)
+
+
+def test_server_search_budget():
+    import server
+
+    assert server.search_budget({}) == (server.SERVER_BUDGET, 0)
+    assert server.search_budget({'time': 1e9, 'depth': 99}) == \
+        (server.SERVER_LIMIT, server.SERVER_DEPTH)
+    assert server.search_budget(json.loads('{"time": 0.5}')) == (0.5, 0)
+    for bad in ['{"time": NaN}', '{"time": Infinity}', '{"time": -1}',
+                '{"time": 0}', '{"depth": -3}', '{"time": "soon"}']:
+        with pytest.raises(ValueError):
+            server.search_budget(json.loads(bad))
+
+
+def write_games(path, games, block_size=10):
+    '''Appends the moves of games to a record file'''
+    import record
+
+    with record.RecordWriter(path, block_size) as writer:
+        for moves in games:
+            writer.write(record.GameRecord(moves))
+
+
+def test_record_index_rebuilt(tmp_path):
+    import record
+
+    rng   = random.Random(6)
+    path  = str(tmp_path / 'games.rvg')
+    games = [random_game(rng) for _ in range(30)]
+    write_games(path, games[:15])
+    os.remove(record.index_path(path))
+    write_games(path, games[15:])
+    assert record.count_records(path) == 30
+    assert len(record.read_index(path)) == 4
+    assert [r.moves for r in record.read_records(path, 12)] == games[12:]
+
+
+def test_record_cut_short_block_dropped(tmp_path):
+    import record
+
+    rng   = random.Random(8)
+    path  = str(tmp_path / 'games.rvg')
+    games = [random_game(rng) for _ in range(30)]
+    write_games(path, games[:20])
+    with open(path, 'ab') as f:
+        f.write(record.BLOCK.pack(5, 500) + b'cut short')
+    write_games(path, games[20:])
+
+    with open(record.index_path(path), 'rb') as f:
+        indexed = list(record.INDEX.iter_unpack(f.read()))
+    assert record.read_index(path) == indexed
+    assert record.scan_blocks(path) == indexed
+    assert [r.moves for r in record.read_records(path)] == games
+
+
+def pass_position(seed=0):
+    '''Returns a BitBoard where the player to move has to pass, but the
+       other player has a move.
+    '''
+
+    rng = random.Random(seed)
+    while True:
+        board = BitBoard(8)
+        while board.valid_moves() != []:
+            board.do_move(rng.choice(board.valid_moves()))
+        board.switch_turns()
+        if board.valid_moves() != []:
+            board.switch_turns()
+            return board
+
+
+def test_analyze_position_fields():
+    import analyze
+
+    analyze.init_worker(3, 1.0)
+    board  = pass_position()
+    result = analyze.analyze_position(board.encode())
+    assert result['pass']
+    assert result['turn'] == ('white' if board.turn is BLACK else 'black')
+    assert result['exact'] == (board.empties <= ENDGAME_EMPTIES)
+
+    board  = random_positions(1, 20, seed=9)[0]
+    result = analyze.analyze_position(board.encode())
+    assert not result['pass'] and not result['exact']
+    assert result['turn'] == ('black' if board.turn is BLACK else 'white')
+
+
+def test_analyze_order_independent():
+    import analyze
+
+    analyze.init_worker(4, 1.0)
+    codes = [b.encode() for b in random_positions(3, 18, seed=10)]
+    first = [analyze.analyze_position(code) for code in codes]
+    again = [analyze.analyze_position(code) for code in reversed(codes)]
+    for a, b in zip(first, reversed(again)):
+        assert (a['score'], a['nodes']) == (b['score'], b['nodes'])
+
+
+def test_gui_dirty_frames_match_redraw(monkeypatch):
+    pytest.importorskip('pygame')
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import guibench
+    import pygame
+
+    pygame.init()
+    try:
+        assert guibench.check(120, 4) == 0
+    finally:
+        pygame.quit()
+
+
+def test_tournament_board_size():
+    import tournament
+
+    config  = tournament.parse_config('size=6,cutoff_depth=1')
+    opening = tournament.random_openings(1, 2, size=6)[0]
+    result  = tournament.play_game(config, config, opening, BLACK)
+    assert result['a_discs'] + result['b_discs'] <= 36
+    with pytest.raises(ValueError):
+        tournament.play_game(config, tournament.parse_config(''), opening,
+                             WHITE)
@@ -0,0 +1,302 @@
+#! /usr/bin/env python
+# title           :tournament.py
+# description     :Plays matches between two engine configurations
+# author          :andresthor
+# date            :05-02-2017
+# usage           :python tournament.py --a cutoff_depth=3 --b cutoff_depth=4
+# python_version  :3.5.2
+# =============================================================================
+
+from constants import BLACK, WHITE, BOARD_SIZE
+from reversi import Reversi
+from reversiboard import ReversiBoard
+from bitboard import BitBoard
+from patterns import PatternEvaluator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import ast
+import book
+import math
+import random
+import signal
+from time import time
+
+BOARDS     = {'list': ReversiBoard, 'bitboard': BitBoard}
+EVALUATORS = {'default': lambda size: None, 'patterns': PatternEvaluator}
+
+# Both sides search to a fixed depth unless told otherwise
+DEFAULTS = {'time_cut': False, 'cutoff_depth': 3}
+
+
+def parse_config(text):
+    '''Parses an engine configuration such as "cutoff_depth=4,eval=patterns"
+       into a dict. Values are read as Python literals where possible.
+    '''
+
+    config = dict(DEFAULTS)
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        key, _, value = item.partition('=')
+        try:
+            value = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            value = value.strip()
+        config[key.strip()] = value
+    return config
+
+
+def make_engine(config):
+    '''Creates a Reversi engine from a configuration. board and eval pick the
+       board class and evaluator, size the board size, book turns the opening
+       book on, and every other key is set as an attribute of the engine.
+    '''
+
+    options = dict(config)
+    board   = BOARDS[options.pop('board', 'bitboard')]
+    size    = options.pop('size', BOARD_SIZE)
+    engine  = Reversi(board, EVALUATORS[options.pop('eval', 'default')](size),
+                      size)
+    if not options.pop('book', False):
+        engine.book = None
+
+    for key, value in options.items():
+        if not hasattr(engine, key):
+            raise ValueError('Unknown engine option: {}'.format(key))
+        setattr(engine, key, value)
+    return engine
+
+
+def random_openings(count, plies, seed=0, size=BOARD_SIZE):
+    '''Returns count distinct positions on a size x size board reached by
+       playing plies random moves from the start, as encoded (black, white,
+       turn) tuples.
+    '''
+
+    rng      = random.Random(seed)
+    openings = []
+    seen     = set()
+    tries    = 0
+    while len(openings) < count and tries < 100 * count:
+        tries += 1
+        board = BitBoard(size)
+        for _ in range(plies):
+            moves = board.valid_moves()
+            if moves == []:
+                break
+            board.do_move(rng.choice(moves))
+        code = board.encode()
+        if code not in seen and board.valid_moves() != []:
+            seen.add(code)
+            openings.append(code)
+    return openings
+
+
+def book_openings(plies):
+    '''Returns every canonical book position after exactly plies moves, as
+       encoded (black, white, turn) tuples.
+    '''
+
+    openings = []
+    for (black, white, turn), board in book.book_positions(plies + 1).items():
+        if 4 + plies == bin(black | white).count('1'):
+            openings.append((black, white, board.turn))
+    return sorted(openings)
+
+
+def init_worker():
+    '''Leaves Ctrl-C to the main process, which stops the match'''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def board_size(config_a, config_b):
+    '''Returns the board size of a match between the engine configurations.
+       Raises ValueError if they are set up for different sizes.
+    '''
+
+    size_a = config_a.get('size', BOARD_SIZE)
+    size_b = config_b.get('size', BOARD_SIZE)
+    if size_a != size_b:
+        raise ValueError('A plays on {}x{} and B on {}x{}'.format(
+            size_a, size_a, size_b, size_b))
+    return size_a
+
+
+def play_game(config_a, config_b, opening, a_color):
+    '''Plays one game from opening between the engine configurations, with A
+       playing a_color. Returns a dict with the disc counts, the score for A
+       (1, 0.5 or 0) and the nodes, time and moves of each side.
+    '''
+
+    size    = board_size(config_a, config_b)
+
+    engines = {a_color: make_engine(config_a)}
+    b_color = WHITE if a_color is BLACK else BLACK
+    engines[b_color] = make_engine(config_b)
+    stats   = dict((color, {'nodes': 0, 'time': 0.0, 'moves': 0})
+                   for color in (BLACK, WHITE))
+
+    board = BitBoard(size)
+    board.set_position(*opening)
+    while True:
+        if board.valid_moves() == []:
+            board.switch_turns()
+            if board.valid_moves() == []:
+                break
+            continue
+
+        engine = engines[board.turn]
+        engine.board.set_position(*board.encode())
+        start = time()
+        move  = engine.book_move()
+        if move is None:
+            engine.alpha_beta_search()
+            move = engine.get_optimal_move()
+            stats[board.turn]['nodes'] += engine.nodes
+        stats[board.turn]['time']  += time() - start
+        stats[board.turn]['moves'] += 1
+        board.do_move(move)
+
+    a, b = board.score[a_color], board.score[b_color]
+    return {'a_color': a_color, 'a_discs': a, 'b_discs': b,
+            'score': 1.0 if a > b else 0.5 if a == b else 0.0,
+            'a': stats[a_color], 'b': stats[b_color]}
+
+
+def elo(score):
+    '''Returns the Elo difference for an expected score between 0 and 1'''
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+
+class Match(object):
+    '''
+        Running totals of a match between engine A and engine B, updated one
+        game at a time so a summary is available whenever the match stops.
+    '''
+
+    def __init__(self):
+        self.wins   = 0
+        self.draws  = 0
+        self.losses = 0
+        self.scores = []
+        self.totals = {'a': {'nodes': 0, 'time': 0.0, 'moves': 0},
+                       'b': {'nodes': 0, 'time': 0.0, 'moves': 0}}
+
+    def add(self, result):
+        '''Adds the result of a game from play_game'''
+        self.scores.append(result['score'])
+        if result['score'] == 1.0:
+            self.wins += 1
+        elif result['score'] == 0.5:
+            self.draws += 1
+        else:
+            self.losses += 1
+        for side in ('a', 'b'):
+            for key in self.totals[side]:
+                self.totals[side][key] += result[side][key]
+
+    def elo(self):
+        '''Returns (elo, error) for A against B, where error is the half width
+           of the 95% confidence interval.
+        '''
+
+        n = len(self.scores)
+        if n == 0:
+            return 0.0, float('inf')
+        mean  = sum(self.scores) / n
+        var   = sum((s - mean) ** 2 for s in self.scores) / n
+        error = 1.96 * math.sqrt(var / n)
+        low, high = elo(mean - error), elo(mean + error)
+        return elo(mean), (high - low) / 2
+
+    def nps(self, side):
+        '''Returns the average nodes per second of a side'''
+        t = self.totals[side]
+        return t['nodes'] / t['time'] if t['time'] else 0.0
+
+    def time_per_move(self, side):
+        '''Returns the average time per move of a side'''
+        t = self.totals[side]
+        return t['time'] / t['moves'] if t['moves'] else 0.0
+
+    def line(self):
+        '''Returns the running W-D-L and Elo as one line'''
+        rating, error = self.elo()
+        return 'W-D-L {}-{}-{}  Elo {:+.0f} +/- {:.0f}'.format(
+            self.wins, self.draws, self.losses, rating, error)
+
+    def summary(self):
+        '''Returns a summary of the match so far'''
+        lines = ['Games: {}  {}'.format(len(self.scores), self.line())]
+        for side in ('a', 'b'):
+            lines.append('{}: {:.0f} nodes/s, {:.3f}s per move'.format(
+                side.upper(), self.nps(side), self.time_per_move(side)))
+        return '\n'.join(lines)
+
+
+def run_match(config_a, config_b, openings, games, workers=None):
+    '''Plays games between A and B over a process pool, cycling through the
+       openings. Every opening is played twice, once with A as black and
+       once as white. Prints every result as it comes in, and returns the
+       Match. Ctrl-C stops the match early and keeps the games played so far.
+    '''
+
+    match   = Match()
+    pool    = ProcessPoolExecutor(workers, initializer=init_worker)
+    jobs    = [(openings[(i // 2) % len(openings)],
+                BLACK if i % 2 == 0 else WHITE) for i in range(games)]
+    futures = []
+    try:
+        for opening, color in jobs:
+            futures.append(pool.submit(play_game, config_a, config_b, opening,
+                                       color))
+        for future in as_completed(futures):
+            result = future.result()
+            match.add(result)
+            side = 'black' if result['a_color'] is BLACK else 'white'
+            print('Game {:4d}: A ({}) {:2d}-{:2d}  {}'.format(
+                len(match.scores), side, result['a_discs'],
+                result['b_discs'], match.line()), flush=True)
+    except KeyboardInterrupt:
+        print('Stopped early')
+        for future in futures:
+            future.cancel()
+    finally:
+        pool.shutdown(wait=False)
+
+    return match
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Plays a match between two engine configurations')
+    parser.add_argument('--a', default='', help='options of engine A, '
+                        'e.g. cutoff_depth=4,eval=patterns,board=list')
+    parser.add_argument('--b', default='', help='options of engine B')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--plies', type=int, default=4,
+                        help='length of the random or book openings')
+    parser.add_argument('--book', action='store_true',
+                        help='start from book positions instead of random')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config_a = parse_config(args.a)
+    config_b = parse_config(args.b)
+    try:
+        size = board_size(config_a, config_b)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.book:
+        if size != 8:
+            parser.error('The book only has 8x8 openings')
+        openings = book_openings(args.plies)
+    else:
+        openings = random_openings((args.games + 1) // 2, args.plies,
+                                   args.seed, size)
+
+    print('A: {}\nB: {}'.format(config_a, config_b))
+    match = run_match(config_a, config_b, openings, args.games, args.workers)
+    print(match.summary())
@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# title           :transposition.py
+# description     :A fixed size transposition table for the Reversi search
+# author          :andresthor
+# date            :05-02-2017
+# python_version  :3.5.2
+# =============================================================================
+
+from array import array
+from constants import TT_MEMORY, TT_POLICY
+
+# Bound types of a stored value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Bytes used per entry: key (8), value (8), depth (1), bound (1), move (2),
+# age (1)
+ENTRY_SIZE = 21
+
+POLICIES = ['depth', 'always']
+
+
+def encode_move(tile):
+    '''Packs a (column, row) tuple into a single integer, 0 for no move'''
+    if tile is None:
+        return 0
+    return (tile[0] << 8) | tile[1]
+
+
+def decode_move(code):
+    '''Unpacks a move packed with encode_move'''
+    if code == 0:
+        return None
+    return (code >> 8, code & 0xff)
+
+
+class TranspositionTable(object):
+    '''
+        Stores search results by Zobrist hash in preallocated arrays, so the
+        memory used never grows past max_bytes.
+
+        Each slot holds the depth searched, the bound type (EXACT, LOWER or
+        UPPER), the value and the best move. When two positions map to the
+        same slot the policy decides which one is kept:
+            'depth'  - keep the deeper entry, unless it is from an old search
+            'always' - the newest entry always replaces the old one
+    '''
+
+    def __init__(self, max_bytes=TT_MEMORY, policy=TT_POLICY):
+        if policy not in POLICIES:
+            raise ValueError('Unknown replacement policy: {}'.format(policy))
+
+        self.capacity = max(1, max_bytes // ENTRY_SIZE)
+        self.policy   = policy
+        self.age      = 0
+
+        self.keys     = array('Q', [0]) * self.capacity
+        self.values   = array('d', [0.0]) * self.capacity
+        self.depths   = array('b', [-1]) * self.capacity
+        self.bounds   = array('B', [0]) * self.capacity
+        self.moves    = array('H', [0]) * self.capacity
+        self.ages     = array('B', [0]) * self.capacity
+
+        self.used     = 0
+        self.probes   = 0
+        self.hits     = 0
+        self.stores   = 0
+
+    def new_search(self):
+        '''Marks the start of a new search. Entries from earlier searches are
+           kept, but may be replaced regardless of their depth.
+        '''
+        self.age = (self.age + 1) % 256
+
+    def clear(self):
+        '''Removes all entries from the table'''
+        self.__init__(self.capacity * ENTRY_SIZE, self.policy)
+
+    def probe(self, key):
+        '''Returns (depth, bound, value, move) for the position, or None if
+           it is not in the table.
+        '''
+
+        self.probes += 1
+        i = key % self.capacity
+        if self.depths[i] < 0 or self.keys[i] != key:
+            return None
+
+        self.hits += 1
+        return (self.depths[i], self.bounds[i], self.values[i],
+                decode_move(self.moves[i]))
+
+    def store(self, key, depth, bound, value, move):
+        '''Stores a search result, following the replacement policy'''
+
+        i = key % self.capacity
+        if self.depths[i] < 0:
+            self.used += 1
+        elif self.policy == 'depth' and self.keys[i] != key:
+            if self.ages[i] == self.age and self.depths[i] > depth:
+                return
+
+        self.stores    += 1
+        self.keys[i]    = key
+        self.values[i]  = value
+        self.depths[i]  = min(depth, 127)
+        self.bounds[i]  = bound
+        self.moves[i]   = encode_move(move)
+        self.ages[i]    = self.age
+
+    def usage(self):
+        '''Returns the fraction of slots in use'''
+        return self.used / self.capacity